@@ -1 +1 @@
-__version__ = '1.14.0'
+__version__ = '1.15.0'
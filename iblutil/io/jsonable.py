@@ -1,21 +1,196 @@
+import os
 import json
-from typing import Any, List, Tuple
+import mmap
+import shutil
+import pickle
+import logging
+import tempfile
+from pathlib import Path
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from typing import Any, Iterator, List, Tuple
 
+import numpy as np
 import pandas as pd
 
+try:
+    import orjson
+except ImportError:  # orjson is optional; fall back on the standard library
+    orjson = None
 
-def read(file):
-    data = []
-    with open(file, 'r') as f:
+BUF_SIZE = 2 ** 16  # 64 KiB read/write buffer
+PARALLEL_MIN_SIZE = 2 ** 24  # files under 16 MiB are always parsed in the calling process
+
+_logger = logging.getLogger(__name__)
+
+
+def _loads(line):
+    """
+    Parse a single JSON line.
+
+    orjson is used when installed.  As it rejects the NaN and Infinity literals that the standard
+    library writes by default, lines containing them are parsed with the json module instead.
+
+    Parameters
+    ----------
+    line : bytes, str
+        A JSON encoded line.
+
+    Returns
+    -------
+    any
+        The deserialized object.
+    """
+    if orjson is not None:
+        try:
+            return orjson.loads(line)
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(line)
+
+
+def _line_ends(buffer, start=0, stop=None, chunk_size=2 ** 26):
+    """
+    Find the position of each line end in a buffer.
+
+    The newline characters are found with a vectorized comparison, in chunks of 64 MiB to bound
+    the memory used.  The final line end is the buffer size if it lacks a trailing newline.
+
+    Parameters
+    ----------
+    buffer : mmap.mmap, bytes
+        A buffer of JSON lines.
+    start : int
+        The position to start from.
+    stop : int
+        The position to stop at, i.e. the end of the last line to find (default: buffer end).
+    chunk_size : int
+        The number of bytes to compare at a time.
+
+    Returns
+    -------
+    numpy.array
+        The positions of the line ends, i.e. one past the last character of each line.
+    """
+    data = np.frombuffer(buffer, dtype=np.uint8)[:stop]
+    ends = [np.flatnonzero(data[i:i + chunk_size] == 10) + i for i in range(start, data.size, chunk_size)]
+    ends = np.concatenate(ends) if ends else np.array([], dtype=np.intp)
+    if (ends[-1] + 1 if ends.size else start) < data.size:  # no trailing newline
+        ends = np.append(ends, data.size)
+    return ends
+
+
+def _parse_range(file, start, end):
+    """
+    Parse the task data lines of a file between two byte positions.
+
+    This is called by the worker processes of load_task_jsonable.
+
+    Returns
+    -------
+    list of dict
+        The trial info, without the 'behavior_data' key.
+    list
+        The Bpod timing data for each trial.
+    """
+    trials_table, bpod_data = [], []
+    with open(file, 'rb') as f:
+        f.seek(start, 0)
+        for line in f.read(end - start).splitlines():
+            trial = _loads(line)
+            bpod_data.append(trial.pop('behavior_data'))
+            trials_table.append(trial)
+    return trials_table, bpod_data
+
+
+def _append_trial(columns, trial, n):
+    """
+    Append the values of a trial to a map of columns.
+
+    As with the DataFrame constructor, columns are padded with NaN where a key is missing from
+    this trial or from the preceding ones.
+
+    Parameters
+    ----------
+    columns : dict of list
+        A map of trial info keys to their values for the preceding trials.
+    trial : dict
+        The trial info to append.
+    n : int
+        The number of preceding trials.
+    """
+    for key, value in trial.items():
+        if (column := columns.get(key)) is None:
+            column = columns[key] = [np.nan] * n
+        column.append(value)
+    if len(trial) != len(columns):
+        for column in columns.values():
+            if len(column) == n:
+                column.append(np.nan)
+
+
+def _trials_table(columns):
+    """
+    Build a trials table from a map of columns.
+
+    Columns holding integers outside the int64 range are kept as object arrays so that pandas
+    does not cast them to float, losing precision.
+
+    Parameters
+    ----------
+    columns : dict of list
+        A map of trial info keys to their values, as built by _append_trial.
+
+    Returns
+    -------
+    pandas.DataFrame
+        A DataFrame with the trial info.
+    """
+    lo, hi = np.iinfo(np.int64).min, np.iinfo(np.int64).max
+    for key, column in columns.items():
+        if any(type(v) is int and not lo <= v <= hi for v in column):
+            columns[key] = pd.Series(column, dtype=object)
+    return pd.DataFrame(columns)
+
+
+def iter_jsonable(file) -> Iterator[Any]:
+    """
+    Iterate over the deserialized lines of a jsonable file.
+
+    Unlike read, only one line is held in memory at a time.
+
+    Parameters
+    ----------
+    file : str, pathlib.Path
+        Full path to jsonable file.
+
+    Yields
+    ------
+    any
+        The deserialized object of each line.
+    """
+    with open(file, 'rb', buffering=BUF_SIZE) as f:
         for line in f:
-            data.append(json.loads(line))
-    return data
+            yield _loads(line)
+
+
+def read(file):
+    return list(iter_jsonable(file))
 
 
 def _write(file, data, mode):
-    with open(file, mode) as f:
+    # Serialized lines are accumulated in a single buffer that is written out in BUF_SIZE chunks.
+    # Lines always end in LF, including on Windows; the readers also accept CRLF line endings.
+    buffer = bytearray()
+    with open(file, mode + 'b') as f:
         for obj in data:
-            f.write(json.dumps(obj) + '\n')
+            buffer += json.dumps(obj).encode()
+            buffer += b'\n'
+            if len(buffer) >= BUF_SIZE:
+                f.write(buffer)
+                buffer.clear()
+        f.write(buffer)
 
 
 def write(file, data):
@@ -26,7 +201,155 @@ def append(file, data):
     _write(file, data, 'a')
 
 
-def load_task_jsonable(jsonable_file, offset: int = None) -> Tuple[pd.DataFrame, List[Any]]:
+def append_bytes(file, data):
+    """
+    Append pre-serialized JSON lines to a file without parsing them.
+
+    Parameters
+    ----------
+    file : str, pathlib.Path
+        The jsonable file to append to.
+    data : bytes
+        One or more newline terminated JSON lines.
+    """
+    with open(file, 'ab') as f:
+        f.write(data)
+
+
+def concat(file, *sources):
+    """
+    Append the lines of one or more jsonable files to another.
+
+    The files are copied in blocks without parsing.  A newline is added after any source file
+    lacking a trailing one.
+
+    Parameters
+    ----------
+    file : str, pathlib.Path
+        The jsonable file to append to.
+    *sources : str, pathlib.Path
+        The jsonable files to copy.
+    """
+    with open(file, 'ab') as f:
+        for source in sources:
+            with open(source, 'rb') as src:
+                shutil.copyfileobj(src, f, length=2 ** 20)
+                if src.tell():  # check the last character of non-empty files
+                    src.seek(-1, 2)
+                    if src.read(1) != b'\n':
+                        f.write(b'\n')
+
+
+def iter_task_jsonable(jsonable_file, offset: int = None) -> Iterator[Tuple[dict, Any]]:
+    """
+    Iterate over the trials of a task data jsonable file.
+
+    Unlike load_task_jsonable, only one trial is held in memory at a time.
+
+    Parameters
+    ----------
+    jsonable_file : str, pathlib.Path
+        Full path to jsonable file.
+    offset : int
+        The offset to start reading from (default: None).
+
+    Yields
+    ------
+    dict
+        The trial info.
+    any
+        The timing data for the trial.
+    """
+    with open(jsonable_file, 'rb', buffering=BUF_SIZE) as f:
+        if offset is not None:
+            f.seek(offset, 0)
+        for line in f:
+            trial = _loads(line)
+            yield trial, trial.pop('behavior_data')
+
+
+@contextmanager
+def _atomic_open(file):
+    """
+    Open a temporary file for binary writing that replaces a given file on exit.
+
+    The temporary file has a unique name in the same directory, so concurrent writers never
+    share it and the destination file is never partially written.  It is removed on error.
+
+    Parameters
+    ----------
+    file : pathlib.Path
+        The destination file path.
+
+    Yields
+    ------
+    file object
+        The open temporary file.
+    """
+    f = tempfile.NamedTemporaryFile(dir=file.parent, prefix=file.name + '.', suffix='.tmp', delete=False)
+    try:
+        with f:
+            yield f
+        os.replace(f.name, file)
+    except BaseException:
+        Path(f.name).unlink(missing_ok=True)
+        raise
+
+
+def line_offsets(file, cache=False) -> np.ndarray:
+    """
+    Return the byte offset of each line in a jsonable file.
+
+    The offsets may be passed to load_task_jsonable to resume reading from a given line.
+
+    Parameters
+    ----------
+    file : str, pathlib.Path
+        Full path to jsonable file.
+    cache : bool
+        If true, the offsets are loaded from an index file alongside the jsonable file, with the
+        '.idx' extension appended.  The index is (re)built when missing or when the size or
+        modification time of the jsonable file has changed.
+
+    Returns
+    -------
+    numpy.array
+        The start position of each line.
+
+    Examples
+    --------
+    Load the trials from the 10th onwards
+
+    >>> offsets = line_offsets(jsonable_file)
+    >>> trials_table, bpod_data = load_task_jsonable(jsonable_file, offset=offsets[10])
+    """
+    file = Path(file)
+    index_file = file.with_name(file.name + '.idx')
+    with open(file, 'rb') as f:
+        stat = os.fstat(f.fileno())
+        # The index file header holds the size and modification time of the indexed file
+        header = np.array([stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+        if cache and index_file.exists():
+            index = np.fromfile(index_file, dtype=np.int64)
+            if np.array_equal(index[:2], header):
+                return index[2:]
+        if stat.st_size == 0:  # an empty file cannot be memory mapped
+            offsets = np.array([], dtype=np.int64)
+        else:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                ends = _line_ends(mm)
+            offsets = np.r_[0, ends[:-1] + 1].astype(np.int64)
+    if cache:
+        try:  # write to a unique temporary file first so that the index is never partially written
+            with _atomic_open(index_file) as f:
+                f.write(np.r_[header, offsets].tobytes())
+        except OSError as ex:
+            _logger.debug('Failed to write line index %s: %s', index_file, ex)
+    return offsets
+
+
+def load_task_jsonable(jsonable_file, offset: int = None, processes: int = None,
+                       trial_range: Tuple[int, int] = None, cache: bool = False) -> Tuple[pd.DataFrame, List[Any]]:
     """
     Reads in a task data jsonable file and returns a trials dataframe and a bpod data list.
 
@@ -36,6 +359,18 @@ def load_task_jsonable(jsonable_file, offset: int = None) -> Tuple[pd.DataFrame,
         Full path to jsonable file.
     offset : int
         The offset to start reading from (default: None).
+    processes : int
+        If set, files larger than PARALLEL_MIN_SIZE are split into this many chunks that are
+        parsed in separate processes (default: None, parse in the calling process).
+    trial_range : (int, int)
+        The start and stop index of the trials to load, as in a slice, e.g. (-100, None) loads
+        the last 100 trials.  The line offsets are cached in an index file alongside the jsonable
+        file so that only the requested lines are read on subsequent calls (see line_offsets).
+    cache : bool
+        If true, the output is pickled to a file alongside the jsonable file, with the '.pkl'
+        extension appended, and loaded from there on subsequent calls until the size or
+        modification time of the jsonable file changes.  Only applies when loading all trials.
+        NB: Only use with trusted files as unpickling may execute arbitrary code.
 
     Returns
     -------
@@ -44,17 +379,84 @@ def load_task_jsonable(jsonable_file, offset: int = None) -> Tuple[pd.DataFrame,
     list
         Timing data for each trial.
     """
-    trials_table = []
-    with open(jsonable_file) as f:
+    if cache and offset is None and trial_range is None:
+        return _load_task_jsonable_cached(jsonable_file, processes=processes)
+
+    start, stop = offset or 0, None
+    if trial_range is not None:
         if offset is not None:
-            f.seek(offset, 0)
-        for line in f:
-            trials_table.append(json.loads(line))
+            raise ValueError('offset and trial_range are mutually exclusive')
+        offsets = line_offsets(jsonable_file, cache=True)
+        first, last, _ = slice(*trial_range).indices(offsets.size)
+        if first >= last:
+            return pd.DataFrame(), []
+        start, stop = offsets[first], (offsets[last] if last < offsets.size else None)
 
-    # pop-out the bpod data from the table
-    bpod_data = []
-    for td in trials_table:
-        bpod_data.append(td.pop('behavior_data'))
+    columns, bpod_data = {}, []
+    with open(jsonable_file, 'rb') as f:
+        if (size := os.fstat(f.fileno()).st_size) == 0:  # an empty file cannot be memory mapped
+            return pd.DataFrame(), []
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            ends = _line_ends(mm, start, stop)
+            if processes and (stop or size) - start > PARALLEL_MIN_SIZE:
+                # Split the lines into chunks of roughly equal number
+                chunks = [x for x in np.array_split(ends, processes) if x.size]
+                starts = [start] + [x[-1] + 1 for x in chunks[:-1]]
+                stops = [x[-1] for x in chunks]
+                with ProcessPoolExecutor(processes) as executor:
+                    for trials, bpods in executor.map(_parse_range, repeat(jsonable_file), starts, stops):
+                        for trial, bpod in zip(trials, bpods):
+                            _append_trial(columns, trial, len(bpod_data))
+                            bpod_data.append(bpod)
+                ends = ends[:0]
+            for end in ends.tolist():
+                # pop-out the bpod data from the table
+                trial = _loads(mm[start:end])
+                bpod = trial.pop('behavior_data')
+                _append_trial(columns, trial, len(bpod_data))
+                bpod_data.append(bpod)
+                start = end + 1
 
-    trials_table = pd.DataFrame(trials_table)
+    return _trials_table(columns), bpod_data
+
+
+def _load_task_jsonable_cached(jsonable_file, **kwargs):
+    """
+    Load all trials of a task data jsonable file via a pickle cache.
+
+    The cache file holds the size and modification time of the jsonable file, followed by the
+    output of load_task_jsonable.  It is rewritten when these no longer match.
+
+    Parameters
+    ----------
+    jsonable_file : str, pathlib.Path
+        Full path to jsonable file.
+    **kwargs
+        Optional arguments passed to load_task_jsonable.
+
+    Returns
+    -------
+    pandas.DataFrame
+        A DataFrame with the trial info in the same format as the Session trials table.
+    list
+        Timing data for each trial.
+    """
+    jsonable_file = Path(jsonable_file)
+    cache_file = jsonable_file.with_name(jsonable_file.name + '.pkl')
+    stat = jsonable_file.stat()
+    key = (stat.st_size, stat.st_mtime_ns)
+    if cache_file.exists():
+        try:
+            with open(cache_file, 'rb') as f:
+                if pickle.load(f) == key:
+                    return pickle.load(f)
+        except Exception as ex:  # e.g. a truncated cache or one written by another pandas version
+            _logger.debug('Failed to load cache %s, rebuilding: %s', cache_file, ex)
+    trials_table, bpod_data = load_task_jsonable(jsonable_file, **kwargs)
+    try:  # write to a unique temporary file first so that the cache is never partially written
+        with _atomic_open(cache_file) as f:
+            pickle.dump(key, f, protocol=pickle.HIGHEST_PROTOCOL)
+            pickle.dump((trials_table, bpod_data), f, protocol=pickle.HIGHEST_PROTOCOL)
+    except OSError as ex:
+        _logger.debug('Failed to write cache %s: %s', cache_file, ex)
     return trials_table, bpod_data
@@ -14,16 +14,13 @@ Examples
 ...     server.close()
 """
 import sys
-import json
-import urllib.parse
-import urllib.request
 import asyncio
 import argparse
 import socket
 import logging
 from types import MappingProxyType
 from collections import UserDict
-from functools import partial
+from functools import partial, lru_cache
 
 import colorlog
 
@@ -31,6 +28,10 @@ from iblutil.io.net import base
 from iblutil import util
 
 
+_TRANSPORT_LAYERS = {socket.SOCK_DGRAM: ('UDP', ('udp',)), socket.SOCK_STREAM: ('TCP/IP', ('ws', 'wss', 'tcp'))}
+"""dict: Map of socket type to transport layer name and the URI schemes it supports."""
+
+
 def _setup_log(name, level=logging.DEBUG):
     """A colour log with the log name in the format string"""
     log = logging.getLogger(name)
@@ -47,10 +48,11 @@ def _setup_log(name, level=logging.DEBUG):
     return log
 
 
+@lru_cache(maxsize=256)
 def _address2tuple(address) -> (str, int):
     """Convert URI to (host, port) tuple.
 
-    Convert URI to form used by transport layer.
+    Convert URI to form used by transport layer.  Results are cached by URI.
 
     Parameters
     ----------
@@ -64,9 +66,14 @@ def _address2tuple(address) -> (str, int):
     int
         The port.
     """
-    server_uri = base.validate_uri(address, default_port=base.LISTEN_PORT)
-    parsed_uri = urllib.parse.urlparse(server_uri)
-    return parsed_uri.hostname, parsed_uri.port
+    _, host, port, _ = base.validate_uri(address, default_port=base.LISTEN_PORT, return_parts=True)
+    return host, port
+
+
+def _set_timeout(future):
+    """Set a timeout error on a future that has not yet resolved."""
+    if not future.done():
+        future.set_exception(asyncio.TimeoutError())
 
 
 class EchoProtocol(base.Communicator):
@@ -86,20 +93,32 @@ class EchoProtocol(base.Communicator):
         the server URI.
     default_echo_timeout : float
         The default maximum time in seconds to await a message echo.
+    _default_addr : (str, int)
+        The hostname and port of the server URI.
+    _is_udp : bool
+        True if the server URI scheme is UDP, otherwise the transport is TCP/IP.
     _last_sent : dict[(str, int), (bytes, asyncio.Future)]
         A map of addresses holding the last sent bytes str and the future being waited on.  In
         client mode there should only be one entry - the server URI.
+    _encoded_cache : dict[tuple, bytes]
+        A map of data-less messages, e.g. (ExpMessage.EXPINIT, None), and their serialized form.
     """
 
     Server = None
     _role = None
     default_echo_timeout = 1.
+    _encoded_cache = {}
 
     def __init__(self, server_uri, role, name=None, logger=None):
         super().__init__(server_uri, name=name, logger=logger)
         self._transport = None
         self._socket = None
+        self._peer_addr = None  # The connected TCP/IP peer (host, port)
         self.role = role
+        # The remote address in client role, or the local address in server role
+        self._default_addr = (self.hostname, self.port)
+        # Check the protocol once rather than parsing the URI scheme on each send
+        self._is_udp = self.protocol == 'udp'
         # For validating echo'd response
         self._last_sent = {}
         # Transport specific futures
@@ -303,14 +322,25 @@ class EchoProtocol(base.Communicator):
             token, _ = await fut
             return token
 
-    @staticmethod
-    def encode(data):
-        """Serialize data for transmission"""
-        if isinstance(data, (bytes, bytearray)):
-            return data
-        if not isinstance(data, str):
-            data = json.dumps(data)
-        return data.encode()
+    def _encode_message(self, message) -> bytes:
+        """Serialize a message, memoizing those that consist of an event with no data.
+
+        Parameters
+        ----------
+        message : any
+            The data to serialize.
+
+        Returns
+        -------
+        bytes
+            The encoded data.
+        """
+        if (isinstance(message, tuple) and message and isinstance(message[0], base.ExpMessage)
+                and all(x is None for x in message[1:])):
+            if (encoded := self._encoded_cache.get(message)) is None:
+                encoded = self._encoded_cache[message] = self.encode(message)
+            return encoded
+        return self.encode(message)
 
     def send(self, data, addr=None):
         """Send data to clients.
@@ -318,18 +348,56 @@ class EchoProtocol(base.Communicator):
         Serialize data and pass to transport layer.
         """
         super().send(data, addr=addr)
-        if self.protocol == 'udp':
-            addr = addr or (self.hostname, self.port)
-            self.logger.debug(f'Send "{data}" to udp://{addr[0]}:{addr[1]}')
-            self._transport.sendto(data, addr)
+        self._send_bytes(self.encode(data), addr=addr)
+
+    def _send_bytes(self, data, addr=None):
+        """Pass serialized data to the transport layer.
+
+        Parameters
+        ----------
+        data : bytes
+            The encoded data to send.
+        addr : (str, int)
+            The remote host address and port.
+        """
+        if self._is_udp:
+            self._send_udp(data, addr=addr)
         else:
-            addr = addr or self._socket.getpeername()
-            if addr != self._socket.getpeername():
-                self.logger.warning(f'Message not sent: unexpected address {addr}')
-                return
-            self.logger.debug(f'Send "{data}" to {self.protocol}://{addr[0]}:{addr[1]}')
-            self._transport.write(self.encode(data))
-            # self._transport.write_eof()
+            self._send_tcp(data, addr=addr)
+
+    def _send_udp(self, data, addr=None):
+        """Pass serialized data to the UDP transport layer.
+
+        Parameters
+        ----------
+        data : bytes
+            The encoded data to send.
+        addr : (str, int)
+            The remote host address and port. Only required in server role.
+        """
+        addr = addr or self._default_addr
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug('Send "%s" to udp://%s:%i', data, addr[0], addr[1])
+        self._transport.sendto(data, addr)
+
+    def _send_tcp(self, data, addr=None):
+        """Pass serialized data to the TCP/IP transport layer.
+
+        Parameters
+        ----------
+        data : bytes
+            The encoded data to send.
+        addr : (str, int)
+            The remote host address and port. Must match the connected peer, if provided.
+        """
+        addr = addr or self._peer_addr
+        if addr != self._peer_addr:
+            self.logger.warning('Message not sent: unexpected address %s', addr)
+            return
+        if self.logger.isEnabledFor(logging.DEBUG):  # avoid parsing the protocol when not logged
+            self.logger.debug('Send "%s" to %s://%s:%i', data, self.protocol, addr[0], addr[1])
+        self._transport.write(data)
+        # self._transport.write_eof()
 
     async def confirmed_send(self, data, addr=None, timeout=None):
         """
@@ -362,25 +430,30 @@ class EchoProtocol(base.Communicator):
         if self.role == 'server':
             if not addr:
                 raise TypeError('confirmed_send missing 1 required argument: \'addr\'')
-        elif addr and addr != (self.hostname, self.port):
+        elif addr and addr != self._default_addr:
             raise ValueError('Unexpected remote address')
-        addr = addr or (self.hostname, self.port)
+        addr = addr or self._default_addr
         if not (timeout := timeout or self.default_echo_timeout) > 0:
             raise ValueError('Timeout must be non-zero number')
         loop = asyncio.get_running_loop()
         echo_future = loop.create_future()
         # echo_future.add_done_callback(lambda _: self._last_sent.pop(addr))  # delete below instead (no difference)
-        self._last_sent[addr] = (self.encode(data), echo_future)
-        self.send(self._last_sent[addr][0], addr=addr)
-        # Sockets can no longer be blocking, so we'll wait ourselves.
+        self._last_sent[addr] = (self._encode_message(data), echo_future)
+        self._send_bytes(self._last_sent[addr][0], addr=addr)
+        # Sockets can no longer be blocking, so we'll wait ourselves. Rather than wrapping the
+        # future with asyncio.wait_for, a timer sets the timeout error directly on the future.
+        timer = loop.call_later(timeout, _set_timeout, echo_future) if timeout < float('inf') else None
         try:
-            await asyncio.wait_for(echo_future, timeout=timeout)
+            await echo_future
         except asyncio.TimeoutError:
             self.close()
             raise TimeoutError(f'Failed to receive client response in time ({self.name}: {self.server_uri})')
         except RuntimeError:
             self.close()
             raise RuntimeError('Unexpected response from server')
+        finally:
+            if timer:
+                timer.cancel()
         del self._last_sent[addr]
 
     def close(self):
@@ -395,9 +468,9 @@ class EchoProtocol(base.Communicator):
             self._transport.close()
 
         super().close()  # Deregister callbacks, cancel event futures
-        echo_futures = map(lambda x: x[1], self._last_sent.values())
-        for fut in filter(lambda f: not f.done(), echo_futures):
-            fut.cancel('Close called on communicator')
+        for _, fut in self._last_sent.values():
+            if not fut.done():
+                fut.cancel('Close called on communicator')
         if self.on_error_received and not self.on_error_received.done():
             self.on_error_received.cancel('Close called on communicator')
         if self.on_eof_received and not self.on_eof_received.done():
@@ -413,15 +486,16 @@ class EchoProtocol(base.Communicator):
         self._socket = transport.get_extra_info('socket')
 
         # Validate
-        if self._socket.type is socket.SOCK_DGRAM:
-            if self.protocol != 'udp':
-                raise RuntimeError('Unsupported transport layer for UDP')
-        elif self._socket.type is socket.SOCK_STREAM:
-            if self.protocol not in ('ws', 'wss', 'tcp'):
-                raise RuntimeError('Unsupported transport layer for TCP/IP')
-        else:
+        if (layer := _TRANSPORT_LAYERS.get(self._socket.type)) is None:
             raise RuntimeError(f'Unsupported transport layer with socket type "{self._socket.type.name}"')
-        self.logger.debug(f'Connected with socket {self._socket}')
+        name, protocols = layer
+        if self.protocol not in protocols:
+            raise RuntimeError(f'Unsupported transport layer for {name}')
+        if self._socket.type is socket.SOCK_STREAM:
+            # Each message awaits an echo so send small packets immediately (disable Nagle's algorithm)
+            self._socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self._peer_addr = tuple(transport.get_extra_info('peername')[:2])
+        self.logger.debug('Connected with socket %s', self._socket)
 
     def _receive(self, data, addr):
         """
@@ -449,8 +523,7 @@ class EchoProtocol(base.Communicator):
         EchoProtocol._last_sent[addr][1].add_done_callback.
         - Currently this only checks the received message, not its origin.
         """
-        host, port = addr[:2]
-        msg = data.decode()
+        host, port = addr[0], addr[1]
         # If we're still awaiting echo from this address, process here. NB: sometimes the echo_future is already set
         # but not yet removed from last sent, so we also check future not successfully finished.
         if (last_sent := self._last_sent.get(addr)) and not base.is_success(last_sent[1]):
@@ -463,25 +536,26 @@ class EchoProtocol(base.Communicator):
                 self.logger.info('Confirmation received')
                 echo_future.set_result(True)
         else:
-            self.logger.info('Received %r from %s://%s:%i', msg, self.protocol, host, port)
+            if self.logger.isEnabledFor(logging.INFO):  # avoid decoding when not logged
+                self.logger.info('Received %r from %s://%s:%i', data.decode(), self.protocol, host, port)
             # Update from remote
-            if msg[1] != '0':  # do not echo 0 code messages; these are low-level errors
-                self.logger.debug('Echo %r to %s://%s:%i', msg, self.protocol, host, port)
-                self.send(data, addr)  # Echo
+            if data[1:2] != b'0':  # do not echo 0 code messages; these are low-level errors
+                if self.logger.isEnabledFor(logging.DEBUG):
+                    self.logger.debug('Echo %r to %s://%s:%i', data.decode(), self.protocol, host, port)
+                self._send_bytes(data, addr)  # Echo the received bytes as is
             super()._receive(data, addr)  # Process callbacks
 
     def datagram_received(self, data, addr):
         """Called by UDP transport layer"""
-        host, port = addr[:2]
-        if self.role == 'client' and host != self.hostname:
-            self.logger.warning(
-                f'Ignoring UDP packet from unexpected host ({host}:{port}) with message "{data}"')
+        host, port = addr[0], addr[1]
+        if self.role == 'client' and host != self._default_addr[0]:
+            self.logger.warning('Ignoring UDP packet from unexpected host (%s:%i) with message "%s"', host, port, data)
         else:
             self._receive(data, addr)
 
     def data_received(self, data):
         """Called by TCP/IP transport layer"""
-        addr = self._transport.get_extra_info('peername')[:2]
+        addr = self._peer_addr
         self._receive(data, addr)
 
     def error_received(self, exc):
@@ -519,9 +593,20 @@ class EchoProtocol(base.Communicator):
         -------
         EchoProtocol
             A Communicator instance.
+
+        Notes
+        -----
+        On Linux, several servers may be bound to the same address by passing `reuse_port=True`.
+        The kernel then distributes incoming clients across the sockets, with packets from a given
+        client always delivered to the same server instance.
+
+        Examples
+        --------
+        >>> servers = [await EchoProtocol.server('udp://localhost', reuse_port=True) for _ in range(4)]
         """
         # Validate server URI
         server_uri = base.validate_uri(server_uri)
+        address = _address2tuple(server_uri)
 
         # Get a reference to the event loop
         loop = asyncio.get_running_loop()
@@ -532,12 +617,12 @@ class EchoProtocol(base.Communicator):
         # One protocol instance will be created to serve all client requests.
         if server_uri.startswith('udp'):
             Protocol = partial(EchoProtocol, server_uri, 'server', name=name, logger=log)
-            _, protocol = await loop.create_datagram_endpoint(Protocol, local_addr=_address2tuple(server_uri), **kwargs)
+            _, protocol = await loop.create_datagram_endpoint(Protocol, local_addr=address, **kwargs)
         else:
             protocol = EchoProtocol(server_uri, 'server', name=name, logger=log)
-            protocol.Server = await loop.create_server(lambda: protocol, *_address2tuple(server_uri), **kwargs)
+            protocol.Server = await loop.create_server(lambda: protocol, *address, **kwargs)
 
-        protocol.logger.info(f'Listening on {protocol.server_uri}')
+        protocol.logger.info('Listening on %s', protocol.server_uri)
         return protocol
 
     @staticmethod
@@ -563,6 +648,7 @@ class EchoProtocol(base.Communicator):
         """
         # Validate server URI
         server_uri = base.validate_uri(server_uri)
+        address = _address2tuple(server_uri)
 
         # Get a reference to the event loop
         loop = asyncio.get_running_loop()
@@ -572,16 +658,16 @@ class EchoProtocol(base.Communicator):
 
         Protocol = partial(EchoProtocol, server_uri, 'client', name=name, logger=log)
         if server_uri.startswith('udp'):
-            _, protocol = await loop.create_datagram_endpoint(Protocol, remote_addr=_address2tuple(server_uri), **kwargs)
+            _, protocol = await loop.create_datagram_endpoint(Protocol, remote_addr=address, **kwargs)
         else:
-            _, protocol = await loop.create_connection(Protocol, *_address2tuple(server_uri), **kwargs)
+            _, protocol = await loop.create_connection(Protocol, *address, **kwargs)
 
         return protocol
 
 
 class Services(base.Service, UserDict):
     """Handler for multiple remote rig services."""
-    __slots__ = ('timeout', 'server')
+    __slots__ = ('timeout', 'server', '_rigs')
 
     def __init__(self, remote_rigs, timeout=10.):
         """Handler for multiple remote rig services.
@@ -598,6 +684,7 @@ class Services(base.Service, UserDict):
         if not all(isinstance(x, base.Service) for x in remote_rigs):
             raise TypeError(f'Remote services must be of type {type(base.Service)}')
         self.data = MappingProxyType({rig.name: rig for rig in remote_rigs})  # Ensure immutable
+        self._rigs = tuple(self.data.values())  # For iterating over services without the proxy
         self.timeout = timeout
 
     @property
@@ -621,7 +708,7 @@ class Services(base.Service, UserDict):
         def _callback(service, data, addr):
             callback(data, addr, service)
 
-        for service in self.values():
+        for service in self._rigs:
             if return_service:
                 cb = partial(_callback, service)
                 # keep track of original callback id
@@ -642,7 +729,7 @@ class Services(base.Service, UserDict):
             A specific callback or future to remove.
         """
         removed = {}
-        for rig in self.values():
+        for rig in self._rigs:
             removed[rig.name] = rig.clear_callbacks(event, callback=callback)
         return removed
 
@@ -660,36 +747,31 @@ class Services(base.Service, UserDict):
         dict
             A map of rig name and the data that was received.
         """
-        responses = {}
-
-        async def _return_data(rig, response) -> None:
-            """Return map of rig name and data so we know origin of data"""
-            data, _ = await response
-            responses[rig.name] = data
-            return response
-
         event = base.ExpMessage.validate(event)
-        tasks = set()
-        for rig in self.values():
-            task = asyncio.create_task(_return_data(rig, rig.on_event(event)))
-            tasks.add(task)
-
-        if self.timeout:  # py3.11 with asyncio.timeout context manager
-            _, pending = await asyncio.wait(
-                tasks, timeout=self.timeout, return_when=asyncio.ALL_COMPLETED
-            )
-            if any(pending):
-                failed = set(self.keys()).difference(responses.keys())
-                raise asyncio.TimeoutError(
-                    f'The following services failed to respond in time: {failed}')
-        else:
-            await asyncio.gather(*tasks)
+        loop = asyncio.get_running_loop()
+        # Await the event futures directly, keeping track of the service name of each
+        tasks = {rig.name: loop.create_task(rig.on_event(event)) for rig in self._rigs}
 
-        return responses
+        try:
+            if self.timeout:  # py3.11 with asyncio.timeout context manager
+                _, pending = await asyncio.wait(
+                    tasks.values(), timeout=self.timeout, return_when=asyncio.ALL_COMPLETED
+                )
+                if any(pending):
+                    failed = {name for name, task in tasks.items() if task in pending}
+                    raise asyncio.TimeoutError(
+                        f'The following services failed to respond in time: {failed}')
+            else:
+                await asyncio.gather(*tasks.values())
+        finally:
+            for task in tasks.values():  # stop awaiting the event on services that failed to respond
+                task.cancel()  # no-op for completed tasks
+
+        return {name: task.result()[0] for name, task in tasks.items()}
 
     def close(self):
         """Close all communication."""
-        for rig in self.values():
+        for rig in self._rigs:
             rig.close()
 
     async def init(self, data=None, concurrent=True):
@@ -862,9 +944,11 @@ class Services(base.Service, UserDict):
         args
             Positional arguments to pass to method.
         concurrent : bool
-            If true, all services are signaled concurrently.
+            If true, all services are signaled before their responses are awaited together.
+            Unless `reverse` is true, their echoes are also awaited concurrently.
         reverse : bool
-            If true, iterate over services in reverse order.
+            If true, iterate over services in reverse order, awaiting each service's echo before
+            signalling the next.
         kwargs
             Keyword arguments to pass to method.
 
@@ -881,13 +965,26 @@ class Services(base.Service, UserDict):
             # Register event callbacks before sending messages otherwise we may receive a response before callback is
             # created.
             all_responses = asyncio.create_task(self.await_all(event), name='service responses')
-            for service in (reversed(list(self.values())) if reverse else self.values()):
-                f = getattr(service, method or event.name.lower())
-                await f(*args, **kwargs)
-            responses = await all_responses
+            try:
+                if reverse:
+                    # Each service must confirm receipt before the next is signalled
+                    for service in reversed(self._rigs):
+                        await getattr(service, method or event.name.lower())(*args, **kwargs)
+                else:
+                    # Messages are sent in order, then the echoes are awaited together
+                    sends = [asyncio.ensure_future(getattr(service, method or event.name.lower())(*args, **kwargs))
+                             for service in self._rigs]
+                    try:
+                        await asyncio.gather(*sends)
+                    finally:
+                        for send in sends:
+                            send.cancel()  # no-op for completed sends
+                responses = await all_responses
+            finally:
+                all_responses.cancel()  # no-op once the responses are in
         else:
             responses = dict.fromkeys(self.keys())
-            for name, service in (reversed(list(self.items())) if reverse else self.items()):
+            for service in (reversed(self._rigs) if reverse else self._rigs):
                 f = getattr(service, method or event.name.lower())
                 await f(*args, **kwargs)
                 if self.timeout:
@@ -906,7 +1003,7 @@ class Services(base.Service, UserDict):
         alyx : one.webclient.AlyxClient
             An instance of Alyx to extract and send token from.
         """
-        for service in self.values():
+        for service in self._rigs:
             await service.alyx(alyx)
 
 
@@ -956,4 +1053,8 @@ if __name__ == '__main__':
     parser.add_argument('--verbose', '-v', action='count', default=0)
     args = parser.parse_args()  # returns data from the options specified
 
-    asyncio.run(main(args.role, args.host))
+    try:
+        from uvloop import run
+    except ImportError:  # uvloop is optional; fall back on the standard event loop
+        from asyncio import run
+    run(main(args.role, args.host))
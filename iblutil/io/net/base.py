@@ -10,11 +10,28 @@ from urllib.parse import urlparse
 import urllib.request
 import ipaddress
 from operator import or_
-from functools import reduce
+from functools import reduce, lru_cache
 from enum import IntFlag, IntEnum, auto  # py3.11 STRICT
 
+try:
+    import orjson
+except ImportError:  # orjson is optional; fall back on the standard library
+    orjson = None
+
 LISTEN_PORT = 11001  # listen for commands on this port
 PROTOCOL_VERSION = '1.0.0'  # Versioning for ExpMessage, ExpStatus enumerations, and Service base class
+_URI_SCHEME = re.compile(r'(?P<proc>^[a-zA-Z]+(?=://))')  # e.g. 'udp' in 'udp://localhost'
+_HOSTNAME = re.compile(r'^[a-z0-9-]+$')  # valid unresolved hostname
+
+
+def _loads(data):
+    """Parse JSON data, using orjson if installed."""
+    if orjson is not None:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:  # e.g. NaN and Infinity values, which orjson rejects
+            pass
+    return json.loads(data)
 
 
 def is_success(future: asyncio.Future) -> bool:
@@ -22,18 +39,49 @@ def is_success(future: asyncio.Future) -> bool:
     return future.done() and not future.cancelled() and future.exception() is None
 
 
-def external_ip():
+def external_ip(timeout=2.):
     """
     Fetch WAN IP address.
 
     NB: Requires internet.
 
+    Parameters
+    ----------
+    timeout : float
+        The maximum time in seconds to wait for a response.
+
     Returns
     -------
     ipaddress.IPv4Address, ipaddress.IPv6Address
         The computer's default WAN IP address.
+
+    Raises
+    ------
+    urllib.error.URLError, TimeoutError
+        Failed to fetch the IP address within the timeout.
+    """
+    with urllib.request.urlopen('https://ident.me', timeout=timeout) as response:
+        return ipaddress.ip_address(response.read().decode('utf8'))
+
+
+async def external_ip_async(timeout=2.):
     """
-    return ipaddress.ip_address(urllib.request.urlopen('https://ident.me').read().decode('utf8'))
+    Fetch WAN IP address without blocking the event loop.
+
+    See `external_ip` for details.
+
+    Parameters
+    ----------
+    timeout : float
+        The maximum time in seconds to wait for a response.
+
+    Returns
+    -------
+    ipaddress.IPv4Address, ipaddress.IPv6Address
+        The computer's default WAN IP address.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, external_ip, timeout)
 
 
 def is_valid_ip(ip_address) -> bool:
@@ -50,6 +98,9 @@ def is_valid_ip(ip_address) -> bool:
     bool
         True is IP address is valid.
     """
+    # Quickly reject hostnames: IPv4 addresses start with a digit and IPv6 addresses contain a colon
+    if isinstance(ip_address, str) and not (ip_address[:1].isdigit() or ':' in ip_address):
+        return False
     try:
         ipaddress.ip_address(ip_address)
         return True
@@ -57,10 +108,14 @@ def is_valid_ip(ip_address) -> bool:
         return False
 
 
+@lru_cache(maxsize=64)
 def hostname2ip(hostname=None):
     """
     Resolve hostname to IP address.
 
+    Successful look-ups are cached for the lifetime of the process; call
+    `hostname2ip.cache_clear()` if a host's address may have changed.
+
     Parameters
     ----------
     hostname : str, optional
@@ -84,7 +139,7 @@ def hostname2ip(hostname=None):
         raise ValueError(f'Failed to resolve IP for hostname "{hostname}"')
 
 
-def validate_uri(uri, resolve_host=True, default_port=LISTEN_PORT, default_proc='udp'):
+def validate_uri(uri, resolve_host=True, default_port=LISTEN_PORT, default_proc='udp', return_parts=False):
     """
     Ensure URI is complete and correct.
 
@@ -98,11 +153,14 @@ def validate_uri(uri, resolve_host=True, default_port=LISTEN_PORT, default_proc=
         If the port is absent from the URI, append this one.
     default_proc : str
         If the URI scheme is missing, prepend this one.
+    return_parts : bool
+        If true, return the URI scheme, host and port along with the complete URI.
 
     Returns
     -------
     str
-        The complete URI.
+        The complete URI.  If `return_parts` is true, a tuple of (scheme, host, port, URI) is
+        returned instead.
 
     Raises
     ------
@@ -117,7 +175,7 @@ def validate_uri(uri, resolve_host=True, default_port=LISTEN_PORT, default_proc=
     if not isinstance(uri, (str, ipaddress.IPv4Address, ipaddress.IPv6Address)):
         raise TypeError(f'Unsupported URI "{uri}" of type {type(uri)}')
 
-    if isinstance(uri, str) and (proc := re.match(r'(?P<proc>^[a-zA-Z]+(?=://))', uri)):
+    if isinstance(uri, str) and (proc := _URI_SCHEME.match(uri)):
         proc = proc.group()
         uri = uri[len(proc) + 3:]
     else:
@@ -134,7 +192,7 @@ def validate_uri(uri, resolve_host=True, default_port=LISTEN_PORT, default_proc=
     if isinstance(uri, str) and not is_valid_ip(host):
         if resolve_host:
             host = hostname2ip(host)
-        elif not re.match(r'^[a-z0-9-]+$', host):
+        elif not _HOSTNAME.match(host):
             raise ValueError(f'Invalid hostname "{host}"')
     # Validate port
     try:
@@ -142,7 +200,9 @@ def validate_uri(uri, resolve_host=True, default_port=LISTEN_PORT, default_proc=
         assert 1 <= port <= 65535
     except (AssertionError, ValueError):
         raise ValueError(f'Invalid port number: {port or default_port}')
-    return f'{proc or default_proc}://{host}:{port}'
+    proc, host = proc or default_proc, str(host)
+    uri = f'{proc}://{host}:{port}'
+    return (proc, host, port, uri) if return_parts else uri
 
 
 # class ExpMessage(IntFlag, boundary=STRICT):  # py3.11
@@ -215,15 +275,16 @@ class ExpMessage(IntFlag):
         if not isinstance(event, ExpMessage):
             try:
                 if isinstance(event, str):
-                    event = ExpMessage[event.strip().upper()]
+                    # Only normalize the string if it is not already a member name
+                    event = _EXP_MESSAGES[event if event in _EXP_MESSAGES else event.strip().upper()]
                 elif isinstance(event, int):
-                    event = ExpMessage(event)
+                    event = _EXP_MESSAGES.get(event) or ExpMessage(event)  # compound events are not in the map
                 else:
                     raise TypeError(f'Unknown event type {type(event)}')
             except KeyError:
                 raise ValueError(f'Unrecognized event "{event}". '
                                  f'Choices: {tuple(ExpMessage.__members__.keys())}')
-        if not allow_bitwise and event not in list(ExpMessage):
+        if not allow_bitwise and event.value not in _EXP_MESSAGES:
             raise ValueError('Compound (bitwise) events not permitted. '
                              f'Choices: {tuple(ExpMessage)}')
         return event
@@ -240,6 +301,10 @@ class ExpMessage(IntFlag):
             num ^= b
 
 
+_EXP_MESSAGES = {**{m.value: m for m in ExpMessage}, **{m.name: m for m in ExpMessage}}
+"""dict: Map of the individual ExpMessage values and names to their enumerations."""
+
+
 class ExpStatus(IntEnum):
     """A set of standard statuses for communicating between rigs."""
 
@@ -446,7 +511,7 @@ class Communicator(Service):
     server_uri : str
         The full URI of the remote device, e.g. udp://192.168.0.1:1001
     """
-    __slots__ = ('server_uri', '_callbacks', 'logger', 'name')
+    __slots__ = ('_server_uri', '_parsed_uri', '_callbacks', 'logger', 'name')
 
     def __init__(self, server_uri, name=None, logger=None):
         self.server_uri = validate_uri(server_uri)
@@ -558,22 +623,37 @@ class Communicator(Service):
         loop = asyncio.get_running_loop()
         fut = loop.create_future()
         self.assign_callback(event, fut)
-        return await fut
+        try:
+            return await fut
+        except asyncio.CancelledError:  # stop awaiting the event
+            self.clear_callbacks(event, fut, cancel_futures=False)
+            raise
+
+    @property
+    def server_uri(self) -> str:
+        """str: the full URI of the remote device, e.g. udp://192.168.0.1:1001"""
+        return self._server_uri
+
+    @server_uri.setter
+    def server_uri(self, uri):
+        """Set the URI, parsing it once for the port, hostname and protocol properties."""
+        self._server_uri = uri
+        self._parsed_uri = urlparse(uri)
 
     @property
     def port(self) -> int:
         """int: the remote port"""
-        return int(urlparse(self.server_uri).port)
+        return int(self._parsed_uri.port)
 
     @property
     def hostname(self) -> str:
         """str: the remote hostname or IP address"""
-        return urlparse(self.server_uri).hostname
+        return self._parsed_uri.hostname
 
     @property
     def protocol(self) -> str:
         """str: the protocol scheme, e.g. udp, ws"""
-        return urlparse(self.server_uri).scheme
+        return self._parsed_uri.scheme
 
     @property
     @abstractmethod
@@ -640,7 +720,8 @@ class Communicator(Service):
         """
         Serialize data for transmission.
 
-        None-string or -bytes objects are encoded as JSON before converting to bytes.
+        None-string or -bytes objects are encoded as JSON before converting to bytes.  The standard
+        library is used rather than orjson so that NaN, Infinity and large integers are preserved.
 
         Parameters
         ----------
@@ -652,11 +733,11 @@ class Communicator(Service):
         bytes
             The encoded data.
         """
-        if isinstance(data, bytes):
+        if isinstance(data, (bytes, bytearray)):
             return data
-        if not isinstance(data, str):
-            data = json.dumps(data)
-        return data.encode()
+        if isinstance(data, str):
+            return data.encode()
+        return json.dumps(data).encode()
 
     @staticmethod
     def decode(data: bytes):
@@ -677,7 +758,7 @@ class Communicator(Service):
             Deserialized data.
         """
         try:
-            data = json.loads(data)
+            data = _loads(data)
         except json.JSONDecodeError:
             warnings.warn('Failed to decode as JSON')
             data = data.decode()
@@ -196,6 +196,7 @@ class FileLock:
         self.timeout_action = timeout_action
         if self.timeout_action not in ('delete', 'raise'):
             raise ValueError(f'Invalid timeout action: {self.timeout_action}')
+        self._poll_freq = 0.2  # how long to sleep between lock file checks in sync mode
         self._async_poll_freq = 0.2  # how long to sleep between lock file checks in async mode
 
     @property
@@ -209,17 +210,15 @@ class FileLock:
             await asyncio.sleep(self._async_poll_freq)
 
     def __enter__(self):
-        # if a lock file exists retries n times to see if it exists
-        attempts = 0
-        n_attempts = 5 if self.timeout else inf
-        timeout = (self.timeout / n_attempts) if self.timeout else self._poll_freq
-
-        while self.lockfile.exists() and attempts < n_attempts:
-            self._logger.info('file lock found, waiting %.2f seconds %s', timeout, self.lockfile)
-            time.sleep(timeout)
-            attempts += 1
+        # if a lock file exists, check frequently until it is removed or the timeout is reached
+        if self.lockfile.exists():
+            timeout = self.timeout or inf
+            self._logger.info('file lock found, waiting up to %.2f seconds %s', timeout, self.lockfile)
+            deadline = time.monotonic() + timeout
+            while self.lockfile.exists() and (remaining := deadline - time.monotonic()) > 0:
+                time.sleep(min(self._poll_freq, remaining))
 
-        # if the file still exists after 5 attempts, remove it as it's a job that went wrong
+        # if the file still exists after the timeout, remove it as it's a job that went wrong
         if self.lockfile.exists():
             with open(self.lockfile, 'r') as fp:
                 _contents = json.load(fp) if self.lockfile.stat().st_size else '<empty>'
@@ -51,8 +51,9 @@ def save(filename, table, metadata=None):
 
 
 def uuid2np(eids_uuid):
-    return np.asfortranarray(
-        np.array([np.frombuffer(eid.bytes, dtype=np.int64) for eid in eids_uuid]))
+    # Join the UUID bytes and reinterpret them as two int64 columns in a single pass
+    eids_np = np.frombuffer(b''.join(eid.bytes for eid in eids_uuid), dtype=np.int64)
+    return np.array(eids_np.reshape(-1, 2), order='F')
 
 
 def str2np(eids_str):
@@ -62,22 +63,37 @@ def str2np(eids_str):
     """
     if isinstance(eids_str, str):
         eids_str = [eids_str]
-    return uuid2np([uuid.UUID(eid) if eid else uuid.UUID('0' * 32) for eid in eids_str])
+    # Decode the hex digits of all UUIDs at once
+    hexes = [eid.replace('-', '') if eid else '0' * 32 for eid in eids_str]
+    try:
+        if any(len(h) != 32 for h in hexes):
+            raise ValueError
+        buffer = bytes.fromhex(''.join(hexes))
+        if len(buffer) != 16 * len(hexes):
+            raise ValueError
+    except ValueError:  # e.g. braces or URN prefix, which uuid.UUID accepts
+        return uuid2np([uuid.UUID(eid) if eid else uuid.UUID('0' * 32) for eid in eids_str])
+    return np.array(np.frombuffer(buffer, dtype=np.int64).reshape(-1, 2), order='F')
 
 
 def np2uuid(eids_np):
     if isinstance(eids_np, pd.DataFrame) | isinstance(eids_np, pd.Series):
         eids_np = eids_np.to_numpy()
     if eids_np.ndim >= 2:
-        return [uuid.UUID(bytes=npu.tobytes()) for npu in eids_np]
+        buffer = eids_np.tobytes()
+        return [uuid.UUID(bytes=buffer[i:i + 16]) for i in range(0, len(buffer), 16)]
     else:
         return uuid.UUID(bytes=eids_np.tobytes())
 
 
 def np2str(eids_np):
-    eids = np2uuid(eids_np)
-    eids = str(eids) if isinstance(eids, uuid.UUID) else [str(u) for u in np2uuid(eids_np)]
-    return eids
+    if isinstance(eids_np, pd.DataFrame) | isinstance(eids_np, pd.Series):
+        eids_np = eids_np.to_numpy()
+    # Format the hex digits of all UUIDs without constructing UUID objects
+    h = eids_np.tobytes().hex()
+    eids = [f'{h[i:i + 8]}-{h[i + 8:i + 12]}-{h[i + 12:i + 16]}-{h[i + 16:i + 20]}-{h[i + 20:i + 32]}'
+            for i in range(0, len(h), 32)]
+    return eids if eids_np.ndim >= 2 else eids[0]
 
 
 def is_np_id(id):
@@ -1,4 +1,5 @@
 import hashlib
+import warnings
 from typing import TypeVar, Sequence, Union, Optional, Type
 import uuid
 
@@ -21,15 +22,19 @@ def between_sorted(sorted_v, bounds=None):
     :return:
     """
     bounds = np.array(bounds)
+    if bounds.size == 2:  # a single range is a contiguous slice of the sorted values
+        sel = np.zeros(sorted_v.size, dtype=bool)
+        sel[np.searchsorted(sorted_v, bounds.flat[0]):np.searchsorted(sorted_v, bounds.flat[1], side="right")] = True
+        return sel
     starts, stops = (np.take(bounds, 0, axis=-1), np.take(bounds, 1, axis=-1))
     sbounds = np.logical_and(starts <= sorted_v[-1], stops >= sorted_v[0])
     starts = starts[sbounds]
     stops = stops[sbounds]
-    sel = sorted_v * 0
-    sel[np.searchsorted(sorted_v, starts)] = 1
-    istops = np.searchsorted(sorted_v, stops, side="right")
-    sel[istops[istops < sorted_v.size]] += -1
-    return np.cumsum(sel).astype(bool)
+    # count the ranges each value is in: +1 at the start of each range and -1 after its stop
+    sel = np.zeros(sorted_v.size + 1, dtype=np.int64)
+    np.add.at(sel, np.searchsorted(sorted_v, starts), 1)
+    np.add.at(sel, np.searchsorted(sorted_v, stops, side="right"), -1)
+    return np.cumsum(sel[:-1]).astype(bool)
 
 
 def hash_uuids(uuids, algo="sha256"):
@@ -54,6 +59,11 @@ def ismember(a, b):
     :param b: 1d - array
     :return: isin, locb
     """
+    if a.ndim == 1 and 0 < a.size * np.size(b) <= 4096:
+        # for small arrays, comparing all pairs is faster than the set operations below
+        eq = a[:, np.newaxis] == np.ravel(b)
+        lia = eq.any(axis=1)
+        return lia, eq[lia].argmax(axis=1)  # index of first match
     lia = np.isin(a, b)
     aun, _, iuainv = np.unique(a[lia], return_index=True, return_inverse=True)
     _, ibu, iau = np.intersect1d(b, aun, return_indices=True)
@@ -61,6 +71,39 @@ def ismember(a, b):
     return lia, locb
 
 
+def _sorted_row_groups(a, b, hash_rows=True):
+    """
+    Sort the rows of two 2d arrays together and group identical rows.
+
+    The sort is stable so that, within a group, the rows of a come before the rows of b and the
+    rows of each array are in ascending index order.
+
+    :param a: 2d array
+    :param b: 2d array with the same number of columns as a
+    :param hash_rows: if True, arrays of two 64-bit integer columns are sorted by a hash of each
+    row instead of lexicographically; the order of the groups is then arbitrary
+    :return: order: indices of np.r_[a, b] that sort the rows
+    :return: starts: position in the sorted rows of the first row of each group
+    :return: n_a: the number of rows of a in each group
+    """
+    c = np.concatenate((a, b))
+    if hash_rows and c.shape[1] == 2 and c.dtype.kind in 'iu' and c.dtype.itemsize == 8:
+        # e.g. UUIDs: sorting on a 64-bit hash of each row is faster than a lexsort on two columns
+        key = c[:, 0].view(np.uint64) * np.uint64(0x9E3779B97F4A7C15) ^ c[:, 1].view(np.uint64)
+        order = np.argsort(key, kind='stable')
+        sc, key = c[order], key[order]
+        new_row = np.any(sc[1:] != sc[:-1], axis=1)
+        if np.any(new_row & (key[1:] == key[:-1])):  # hash collision, sort the rows instead
+            return _sorted_row_groups(a, b, hash_rows=False)
+    else:
+        order = np.lexsort(c.T[::-1])
+        sc = c[order]
+        new_row = np.any(sc[1:] != sc[:-1], axis=1)
+    starts = np.flatnonzero(np.r_[c.shape[0] > 0, new_row])
+    n_a = np.add.reduceat((order < a.shape[0]).astype(np.intp), starts)
+    return order, starts, n_a
+
+
 def ismember2d(a, b):
     """
     Equivalent of np.isin but returns indices as in the matlab ismember function
@@ -70,46 +113,17 @@ def ismember2d(a, b):
     :param b: 2d array
     :return: isin, locb
     """
-    from numba import jit
-
-    @jit(nopython=True)
-    def find_first_2d(mat, val):
-        """
-        Returns first index where
-        The purpose of this function is performance: uses low level numba and avoids looping
-        through the full array
-        :param mat: np.array
-        :param val: values to search for
-        :return: index or empty array
-        """
-        for i in np.arange(mat.shape[0]):
-            if np.all(mat[i] == val):
-                return i
-
-    amask = np.ones(a.shape[0], dtype=bool)
-    ia = np.zeros(a.shape, dtype=bool)
-    ib = np.zeros(a.shape, dtype=np.int32) - 1
-    ina = np.zeros(a.shape[0], dtype=bool)
-    bind = np.zeros(a.shape[0], dtype=np.int32) - 1
-    # get a 1d ismember first for each column
-    for n in np.arange(a.shape[1]):
-        iaa, ibb = ismember(a[amask, n], b[:, n])
-        ia[amask, n] = iaa
-        ib[np.where(amask)[0][iaa], n] = ibb
-    # those that have at least one mismatch are not in
-    amask[~np.all(ia, axis=1)] = False
-    # those that get the same index for all column do not need further testing
-    ifound = np.where(amask)[0][np.sum(np.abs(np.diff(ib[amask], axis=1)), axis=1) == 0]
-    ina[ifound] = True
-    amask[ifound] = False
-    bind[ifound] = ib[ifound, 0]
-    # the remaining ones have to be check manually (almost never happens for uuids)
-    for iaa in np.where(amask)[0]:
-        ibb = find_first_2d(b, a[iaa, :])
-        if ibb:
-            ina[iaa] = True
-            bind[iaa] = ibb
-    return ina, bind[ina]
+    nb = b.shape[0]
+    order, starts, n_b = _sorted_row_groups(b, a)
+    # the group of each sorted row; a row of a is in b if its group contains a row of b
+    group = np.repeat(np.arange(starts.size), np.diff(np.r_[starts, order.size]))
+    ia = order >= nb
+    lia = np.zeros(a.shape[0], dtype=bool)
+    lia[order[ia] - nb] = n_b[group[ia]] > 0
+    # the first row of a group is its lowest index in b
+    bind = np.zeros(a.shape[0], dtype=np.intp)
+    bind[order[ia] - nb] = order[starts[group[ia]]]
+    return lia, bind[lia]
 
 
 def intersect2d(a0, a1, assume_unique=False):
@@ -117,21 +131,21 @@ def intersect2d(a0, a1, assume_unique=False):
     Performs intersection on multiple columns arrays a0 and a1
     :param a0:
     :param a1:
-    :param assume_unique: If True, the input arrays are both assumed to be unique,
-    which can speed up the calculation.
-    :return: intersection
+    :param assume_unique: Deprecated, has no effect as the rows are always sorted together.
+    :return: intersection, its rows in ascending lexicographic order
     :return: index of a0 such as intersection = a0[ia, :]
     :return: index of b0 such as intersection = b0[ib, :]
     """
-    _, i0, i1 = np.intersect1d(
-        a0[:, 0], a1[:, 0], return_indices=True, assume_unique=assume_unique
-    )
-    for n in np.arange(1, a0.shape[1]):
-        _, ii0, ii1 = np.intersect1d(
-            a0[i0, n], a1[i1, n], return_indices=True, assume_unique=assume_unique
-        )
-        i0 = i0[ii0]
-        i1 = i1[ii1]
+    if assume_unique:
+        warnings.warn('intersect2d: assume_unique is deprecated and has no effect', DeprecationWarning, stacklevel=2)
+    order, starts, n0 = _sorted_row_groups(a0, a1)
+    # keep the groups containing rows of both arrays, returning the first row of each
+    both = (n0 > 0) & (n0 < np.diff(np.r_[starts, order.size]))
+    i0 = order[starts[both]]
+    i1 = order[starts[both] + n0[both]] - a0.shape[0]
+    # the groups may be in hash order, so sort the (typically few) intersecting rows
+    isort = np.lexsort(a0[i0, :].T[::-1])
+    i0, i1 = i0[isort], i1[isort]
     return a0[i0, :], i0, i1
 
 
@@ -322,6 +336,24 @@ def within_ranges(
         np.diff(ranges, axis=1) > 0
     ), "ranges ends must all be greater than starts"
 
+    labels = np.asarray(labels)
+    # If x is sorted, find the range edges by binary search instead of sorting
+    if np.all(x[1:] >= x[:-1]):
+        # Edges are inclusive: a range starts at the first point >= start and stops after the
+        # last point <= stop
+        starts = np.searchsorted(x, ranges[:, 0], side="left")
+        stops = np.searchsorted(x, ranges[:, 1], side="right")
+        if mode == "matrix":
+            delta = np.zeros((n_labels, n_points + 1), dtype="int32")
+            np.add.at(delta, (labels, starts), 1)
+            np.add.at(delta, (labels, stops), -1)
+            return np.cumsum(delta[:, :-1], axis=1).astype(dtype)
+        elif mode == "vector":
+            delta = np.zeros(n_points + 1, dtype="int32")
+            np.add.at(delta, starts, labels)
+            np.add.at(delta, stops, -labels)
+            return np.cumsum(delta[:-1]).astype(dtype)
+
     # Make array containing points, starts and finishes
 
     # This order means it will be inclusive
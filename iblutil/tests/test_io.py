@@ -1,13 +1,17 @@
 import unittest
 from unittest import mock
 import uuid
+import types
 import tempfile
 import os
+import shutil
 from pathlib import Path
 import json
 import asyncio
+import itertools
 
 import numpy as np
+import pandas as pd
 
 from iblutil.io.parquet import uuid2np, np2uuid, np2str, str2np
 from iblutil.io import params
@@ -29,6 +33,10 @@ class TestParquet(unittest.TestCase):
         uuid_list = ['bc74f49f33ec0f7545ebc03f0490bdf6', 'c5779e6d02ae6d1d6772df40a1a94243',
                      None, '643371c81724378d34e04a60ef8769f4']
         assert np.all(str2np(uuid_list)[2, :] == 0)
+        self.assertEqual(np2str(str2np(uuid_list))[0], str(uuid.UUID(uuid_list[0])))
+        # other formats accepted by uuid.UUID
+        for uuid_str in (f'urn:uuid:{str_uuid}', f'{{{str_uuid}}}', str_uuid.upper()):
+            np.testing.assert_array_equal(str2np(uuid_str), one_np_uuid[np.newaxis, :])
 
     def test_uuids_intersections(self):
         ntotal = 500
@@ -37,10 +45,10 @@ class TestParquet(unittest.TestCase):
 
         eids = uuid2np([uuid.uuid4() for _ in range(ntotal)])
 
-        np.random.seed(42)
-        isel = np.floor(np.argsort(np.random.random(nsub)) / nsub * ntotal).astype(np.int16)
+        rng = np.random.default_rng(42)
+        isel = rng.choice(ntotal, size=nsub, replace=False)
         sids = np.r_[eids[isel, :], uuid2np([uuid.uuid4() for _ in range(nadd)])]
-        np.random.shuffle(sids)
+        rng.shuffle(sids)
 
         # check the intersection
         v, i0, i1 = intersect2d(eids, sids)
@@ -110,21 +118,23 @@ class TestFileLock(unittest.IsolatedAsyncioTestCase):
         self.lock_file.touch()
         assert self.lock_file.exists()
         lock = params.FileLock(self.file, timeout_action='raise')
-        with self.assertLogs('iblutil.io.params', 10) as lg:
+        with self.assertLogs('iblutil.io.params', 10) as lg, \
+                mock.patch('iblutil.io.params.time.monotonic', side_effect=itertools.count(0, 2.5)):
             self.assertRaises(TimeoutError, lock.__enter__)
         msg = next((x.getMessage() for x in lg.records if x.levelno == 10), None)
         self.assertEqual('file lock contents: <empty>', msg)
-        # should try 5 attempts by default; default total timeout is 10 seconds so should sleep 5x for 2 seconds each
-        expected_attempts = 5
-        sleep_mock.assert_called_with(2)
+        # default total timeout is 10 seconds; as 2.5 seconds elapse between checks, should sleep 3 times
+        expected_attempts = 3
+        sleep_mock.assert_called_with(lock._poll_freq)
         self.assertEqual(expected_attempts, sleep_mock.call_count)
-        self.assertEqual(expected_attempts, len([x for x in lg.records if x.levelno == 20]))
+        self.assertEqual(1, len([x for x in lg.records if x.levelno == 20]))
         msg = next(x.getMessage() for x in lg.records if x.levelno == 20)
-        self.assertRegex(msg, 'file lock found, waiting 2.00 seconds')
+        self.assertRegex(msg, 'file lock found, waiting up to 10.00 seconds')
 
         # Check delete timeout action
         assert self.lock_file.exists()
         with self.assertLogs('iblutil.io.params', 10) as lg, \
+                mock.patch('iblutil.io.params.time.monotonic', side_effect=itertools.count(0, 2.5)), \
                 params.FileLock(self.file, timeout_action='delete'):
             # Should have replaced empty lock file with timestamped one
             self.assertTrue(self.lock_file.exists())
@@ -134,6 +144,14 @@ class TestFileLock(unittest.IsolatedAsyncioTestCase):
         self.assertFalse(self.lock_file.exists(), 'Failed to remove lock file upon exit of context manager')
         self.assertRegex(lg.records[-1].getMessage(), 'stale file lock found, deleting')
 
+        # Check lock acquired as soon as the lock file is removed by the other process
+        self.lock_file.touch()
+        sleep_mock.reset_mock()
+        sleep_mock.side_effect = lambda _: self.lock_file.unlink()
+        with params.FileLock(self.file, timeout_action='raise'):
+            self.assertTrue(self.lock_file.exists())
+        sleep_mock.assert_called_once_with(lock._poll_freq)
+
     async def _mock(self, obj):
         """
         Add side effect to mock object that awaits a future.
@@ -214,6 +232,36 @@ class TestsJsonable(unittest.TestCase):
         jsonable.append(self.tfile.name, data)
         data3 = jsonable.read(self.tfile.name)
         self.assertEqual(data + data, data3)
+        self.assertIsInstance(jsonable.iter_jsonable(self.tfile.name), types.GeneratorType)
+        self.assertEqual(data3, list(jsonable.iter_jsonable(self.tfile.name)))
+
+    def testAppendBytes(self):
+        data = [{'a': 'thisisa', 'b': 1}, {'a': 'thisisb', 'b': 2}]
+        jsonable.write(self.tfile.name, data)
+        jsonable.append_bytes(self.tfile.name, b'{"a": "thisisc", "b": 3}\n')
+        self.assertEqual(data + [{'a': 'thisisc', 'b': 3}], jsonable.read(self.tfile.name))
+
+    def testConcat(self):
+        data = [{'a': 'thisisa', 'b': 1}, {'a': 'thisisb', 'b': 2}]
+        jsonable.write(self.tfile.name, data)
+        with tempfile.TemporaryDirectory() as td:
+            # Sources with and without a trailing newline, and an empty one
+            sources = [Path(td).joinpath(f'{i}.jsonable') for i in range(3)]
+            sources[0].write_bytes(b'{"a": "thisisc", "b": 3}\n')
+            sources[1].write_bytes(b'{"a": "thisisd", "b": 4}')
+            sources[2].touch()
+            jsonable.concat(self.tfile.name, *sources, sources[1])
+        expected = data + [{'a': 'thisisc', 'b': 3}] + [{'a': 'thisisd', 'b': 4}] * 2
+        self.assertEqual(expected, jsonable.read(self.tfile.name))
+
+    def testReadNaN(self):
+        """Test that NaN values written by the json module are read back"""
+        data = [{'a': float('nan'), 'b': [1., float('inf')]}, {'a': 1., 'b': []}]
+        jsonable.write(self.tfile.name, data)
+        data2 = jsonable.read(self.tfile.name)
+        self.assertTrue(np.isnan(data2[0]['a']))
+        self.assertEqual([1., float('inf')], data2[0]['b'])
+        self.assertEqual(data[1], data2[1])
 
     def tearDown(self) -> None:
         self.tfile.close()
@@ -241,6 +289,182 @@ class TestLoadTaskData(unittest.TestCase):
 
         assert bpod_data_full[-1] == bpod_data[0]
 
+    def test_iter_task_jsonable(self):
+        jsonable_file = Path(__file__).parent.joinpath('fixtures', 'task_data_short.jsonable')
+        trials_table, bpod_data = jsonable.load_task_jsonable(jsonable_file)
+        trials = jsonable.iter_task_jsonable(jsonable_file)
+        self.assertIsInstance(trials, types.GeneratorType)
+        for i, (trial, bpod) in enumerate(trials):
+            self.assertEqual(trials_table.columns.tolist(), list(trial))
+            self.assertEqual(bpod_data[i], bpod)
+        self.assertEqual(len(bpod_data), i + 1)
+        offset = jsonable.line_offsets(jsonable_file)[1]
+        (trial, bpod), = jsonable.iter_task_jsonable(jsonable_file, offset=offset)
+        self.assertEqual(bpod_data[1], bpod)
+
+    def test_line_offsets(self):
+        jsonable_file = Path(__file__).parent.joinpath('fixtures', 'task_data_short.jsonable')
+        offsets = jsonable.line_offsets(jsonable_file)
+        with open(jsonable_file) as fp:
+            fp.readline()
+            expected = [0, fp.tell()]
+        np.testing.assert_array_equal(expected, offsets)
+        trials_table, bpod_data = jsonable.load_task_jsonable(jsonable_file, offset=offsets[1])
+        self.assertEqual(1, len(bpod_data))
+        with tempfile.TemporaryDirectory() as td:
+            empty_file = Path(td).joinpath('empty.jsonable')
+            empty_file.touch()
+            self.assertEqual(0, jsonable.line_offsets(empty_file).size)
+
+    def test_load_task_jsonable_trial_range(self):
+        jsonable_file = Path(__file__).parent.joinpath('fixtures', 'task_data_short.jsonable')
+        trials_table_full, bpod_data_full = jsonable.load_task_jsonable(jsonable_file)
+        with tempfile.TemporaryDirectory() as td:
+            # Copy fixture so that the index file is created in a temporary directory
+            jsonable_file = shutil.copy(jsonable_file, td)
+            index_file = Path(td).joinpath(Path(jsonable_file).name + '.idx')
+            for trial_range, expected in {(0, 1): [0], (-1, None): [1], (0, 5): [0, 1], (2, 5): []}.items():
+                with self.subTest(trial_range=trial_range):
+                    trials_table, bpod_data = jsonable.load_task_jsonable(jsonable_file, trial_range=trial_range)
+                    self.assertEqual(len(expected), len(bpod_data))
+                    self.assertEqual(expected, trials_table['trial_num'].tolist() if expected else [])
+                    np.testing.assert_equal([bpod_data_full[i] for i in expected], bpod_data)
+            self.assertTrue(index_file.exists())
+            self.assertEqual([], list(Path(td).glob('*.tmp')), 'failed to remove temporary file')
+            # Check the index is loaded from file, then rebuilt once the jsonable file changes
+            offsets = jsonable.line_offsets(jsonable_file)
+            with mock.patch('iblutil.io.jsonable._line_ends') as line_ends:
+                np.testing.assert_array_equal(offsets, jsonable.line_offsets(jsonable_file, cache=True))
+                line_ends.assert_not_called()
+            # Check the temporary file is removed if replacing the index fails
+            index_file.unlink()
+            with mock.patch('iblutil.io.jsonable.os.replace', side_effect=PermissionError), \
+                    self.assertLogs('iblutil.io.jsonable', 'DEBUG'):
+                jsonable.line_offsets(jsonable_file, cache=True)
+            self.assertEqual([], list(Path(td).glob('*.tmp')), 'failed to remove temporary file')
+            self.assertFalse(index_file.exists())
+            jsonable.append(jsonable_file, [{'trial_num': 2, 'behavior_data': {}}])
+            trials_table, _ = jsonable.load_task_jsonable(jsonable_file, trial_range=(-1, None))
+            self.assertEqual([2], trials_table['trial_num'].tolist())
+            self.assertRaises(ValueError, jsonable.load_task_jsonable, jsonable_file, offset=0, trial_range=(0, 1))
+
+    def test_load_task_jsonable_cache(self):
+        jsonable_file = Path(__file__).parent.joinpath('fixtures', 'task_data_short.jsonable')
+        trials_table_full, bpod_data_full = jsonable.load_task_jsonable(jsonable_file)
+        with tempfile.TemporaryDirectory() as td:
+            jsonable_file = Path(shutil.copy(jsonable_file, td))
+            cache_file = jsonable_file.with_name(jsonable_file.name + '.pkl')
+            # Partial loads should not be cached
+            jsonable.load_task_jsonable(jsonable_file, offset=0, cache=True)
+            self.assertFalse(cache_file.exists())
+            trials_table, bpod_data = jsonable.load_task_jsonable(jsonable_file, cache=True)
+            self.assertTrue(cache_file.exists())
+            self.assertTrue(trials_table_full.equals(trials_table))
+            np.testing.assert_equal(bpod_data_full, bpod_data)
+            # Check loaded from cache
+            with mock.patch('iblutil.io.jsonable._line_ends') as line_ends:
+                trials_table, bpod_data = jsonable.load_task_jsonable(jsonable_file, cache=True)
+                line_ends.assert_not_called()
+            self.assertTrue(trials_table_full.equals(trials_table))
+            np.testing.assert_equal(bpod_data_full, bpod_data)
+            # Check cache invalidated when file modified
+            jsonable.append(jsonable_file, [{'trial_num': 2, 'behavior_data': {}}])
+            trials_table, bpod_data = jsonable.load_task_jsonable(jsonable_file, cache=True)
+            self.assertEqual(3, len(trials_table))
+            self.assertEqual({}, bpod_data[-1])
+            self.assertEqual([], list(Path(td).glob('*.tmp')), 'failed to remove temporary file')
+            # Check an unreadable cache is rebuilt
+            for err in (AttributeError, ImportError, ValueError, TypeError):
+                with self.subTest(error=err.__name__), \
+                        mock.patch('iblutil.io.jsonable.pickle.load', side_effect=err), \
+                        self.assertLogs('iblutil.io.jsonable', 'DEBUG'):
+                    trials_table, _ = jsonable.load_task_jsonable(jsonable_file, cache=True)
+                    self.assertEqual(3, len(trials_table))
+            cache_file.write_bytes(cache_file.read_bytes()[:100])  # truncate
+            trials_table, _ = jsonable.load_task_jsonable(jsonable_file, cache=True)
+            self.assertEqual(3, len(trials_table))
+            self.assertTrue(trials_table.equals(jsonable.load_task_jsonable(jsonable_file, cache=True)[0]))
+
+    @mock.patch('iblutil.io.jsonable.PARALLEL_MIN_SIZE', 0)
+    def test_load_task_jsonable_processes(self):
+        jsonable_file = Path(__file__).parent.joinpath('fixtures', 'task_data_short.jsonable')
+        trials_table, bpod_data = jsonable.load_task_jsonable(jsonable_file, processes=3)
+        trials_table_, bpod_data_ = jsonable.load_task_jsonable(jsonable_file)
+        self.assertTrue(trials_table.equals(trials_table_))
+        np.testing.assert_equal(bpod_data_, bpod_data)
+
+    def test_append_trial(self):
+        """Test that building the table by column matches building it by row"""
+        cases = {
+            'flat': [{'a': 1, 'b': 'foo', 'c': .5}, {'b': 'bar', 'a': 2, 'c': float('nan')}],
+            'missing': [{'a': 1}, {'b': 2}, {'a': 3, 'c': True}],
+            'null': [{'a': True}, {'a': None}],
+            'nested': [{'a': [1, 2]}, {'a': [3]}],
+            'mixed': [{'a': 1}, {'a': 'foo'}],
+            'bool': [{'a': float('nan')}, {'a': True}, {'b': 1.5}]
+        }
+        for case, trials in cases.items():
+            with self.subTest(case):
+                expected = pd.DataFrame(trials)
+                columns = {}
+                for i, trial in enumerate(trials):
+                    jsonable._append_trial(columns, trial, i)
+                actual = jsonable._trials_table(columns)
+                self.assertTrue(expected.equals(actual))
+                self.assertEqual(list(expected.dtypes), list(actual.dtypes))
+        # Integers outside the int64 range should be kept as object rather than cast to float
+        cases = {
+            'large': [{'a': 2 ** 70}, {'a': 1}],
+            'negative': [{'a': -2 ** 63 - 1}],
+            'missing': [{'b': 1}, {'a': 2 ** 70}],
+            'null': [{'a': None}, {'a': 2 ** 64 - 1}]
+        }
+        for case, trials in cases.items():
+            with self.subTest(case):
+                columns = {}
+                for i, trial in enumerate(trials):
+                    jsonable._append_trial(columns, trial, i)
+                actual = jsonable._trials_table(columns)
+                self.assertEqual(object, actual['a'].dtype)
+                expected = [trial.get('a') for trial in trials]
+                self.assertEqual([x for x in expected if x is not None], actual['a'].dropna().tolist())
+
+    def test_mixed_line_endings(self):
+        """Test reading files with both CRLF (e.g. written in text mode on Windows) and LF line endings"""
+        jsonable_file = Path(__file__).parent.joinpath('fixtures', 'task_data_short.jsonable')
+        trials_table, bpod_data = jsonable.load_task_jsonable(jsonable_file)
+        with tempfile.TemporaryDirectory() as td:
+            mixed_file = Path(td).joinpath('mixed.jsonable')
+            lines = jsonable_file.read_bytes().splitlines()
+            mixed_file.write_bytes(lines[0] + b'\r\n')
+            jsonable.append(mixed_file, [json.loads(lines[1])])
+            self.assertEqual(mixed_file.read_bytes().count(b'\r\n'), 1)
+            self.assertEqual(jsonable.read(jsonable_file), jsonable.read(mixed_file))
+            np.testing.assert_array_equal(
+                jsonable.line_offsets(mixed_file), [0, len(lines[0]) + 2])
+            for kwargs in ({}, {'trial_range': (-1, None)}, {'cache': True}):
+                with self.subTest(**kwargs):
+                    trials_table_, bpod_data_ = jsonable.load_task_jsonable(mixed_file, **kwargs)
+                    n = len(bpod_data_)
+                    self.assertTrue(trials_table.iloc[-n:].reset_index(drop=True).equals(trials_table_))
+                    np.testing.assert_equal(bpod_data[-n:], bpod_data_)
+
+    def test_load_task_jsonable_edge_cases(self):
+        jsonable_file = Path(__file__).parent.joinpath('fixtures', 'task_data_short.jsonable')
+        with tempfile.TemporaryDirectory() as td:
+            # Expect empty outputs for an empty file
+            empty_file = Path(td).joinpath('empty.jsonable')
+            empty_file.touch()
+            trials_table, bpod_data = jsonable.load_task_jsonable(empty_file)
+            self.assertTrue(trials_table.empty)
+            self.assertEqual([], bpod_data)
+            # Expect the last line to be read when missing a trailing newline
+            truncated_file = Path(td).joinpath('truncated.jsonable')
+            truncated_file.write_bytes(jsonable_file.read_bytes().rstrip(b'\n'))
+            trials_table, bpod_data = jsonable.load_task_jsonable(truncated_file)
+            self.assertEqual(2, trials_table.shape[0])
+            self.assertEqual(2, len(bpod_data))
+
 
 if __name__ == '__main__':
     unittest.main(exit=False, verbosity=2)
@@ -1,5 +1,10 @@
 import sys
+import json
+import math
 import asyncio
+import functools
+import gc
+import weakref
 import logging
 import unittest
 from unittest import mock
@@ -30,6 +35,8 @@ class TestBase(unittest.IsolatedAsyncioTestCase):
         uri = base.validate_uri(ipaddress.ip_address('192.168.0.1'), default_port=9999)
         self.assertEqual(expected, uri)
         self.assertEqual('udp://foobar:11001', base.validate_uri('foobar', resolve_host=False))
+        parts = base.validate_uri('ws://foobar', resolve_host=False, return_parts=True)
+        self.assertEqual(('ws', 'foobar', 11001, 'ws://foobar:11001'), parts)
         # Check IP resolved
         uri = base.validate_uri('http://google.com:80', resolve_host=True)
         expected = (ipaddress.IPv4Address, ipaddress.IPv6Address)
@@ -45,10 +52,34 @@ class TestBase(unittest.IsolatedAsyncioTestCase):
         with self.assertRaises(TypeError):
             base.validate_uri(b'localhost')
 
+    def test_hostname2ip(self):
+        """Test for hostname2ip caching"""
+        base.hostname2ip.cache_clear()
+        with mock.patch('iblutil.io.net.base.socket.gethostbyname', return_value='192.168.0.1') as m:
+            self.assertEqual(ipaddress.ip_address('192.168.0.1'), base.hostname2ip('foobar'))
+            self.assertEqual(ipaddress.ip_address('192.168.0.1'), base.hostname2ip('foobar'))
+            m.assert_called_once_with('foobar')
+        base.hostname2ip.cache_clear()
+
+    def test_is_valid_ip(self):
+        """Test for is_valid_ip"""
+        for ip in ('127.0.0.1', '::1', 'fe80::1', ipaddress.ip_address('192.168.0.1')):
+            self.assertTrue(base.is_valid_ip(ip), ip)
+        for ip in ('localhost', '', '192.168.0', '1.2.3.4.5', 'fe80::g'):
+            self.assertFalse(base.is_valid_ip(ip), ip)
+
     def test_external_ip(self):
         """Test for external_ip"""
         self.assertFalse(ipaddress.ip_address(base.external_ip()).is_private)
 
+    async def test_external_ip_async(self):
+        """Test for external_ip_async and the external_ip timeout"""
+        with mock.patch('iblutil.io.net.base.urllib.request.urlopen') as urlopen:
+            urlopen().__enter__().read.return_value = b'8.8.8.8'
+            ip = await base.external_ip_async(timeout=.5)
+            self.assertEqual(ipaddress.ip_address('8.8.8.8'), ip)
+            urlopen.assert_called_with('https://ident.me', timeout=.5)
+
     def test_ExpMessage(self):
         """Test for ExpMessage.validate method."""
         # Check identity
@@ -79,8 +110,16 @@ class TestBase(unittest.IsolatedAsyncioTestCase):
         """Tests for iblutil.io.net.base.Communicator.encode"""
         message = [None, 21, 'message']
         encoded = base.Communicator.encode(message)
-        self.assertEqual(encoded, b'[null, 21, "message"]')
-        self.assertEqual(base.Communicator.encode(encoded), b'[null, 21, "message"]')
+        self.assertIsInstance(encoded, bytes)
+        self.assertEqual(message, json.loads(encoded))
+        self.assertIs(base.Communicator.encode(encoded), encoded)
+        self.assertEqual(b'message', base.Communicator.encode('message'))
+        self.assertEqual(b'[null, 21, "message"]', base.Communicator.encode(message))
+        # Check that non-finite floats and large integers survive a round trip
+        message = [float('nan'), float('inf'), 2**70]
+        decoded = base.Communicator.decode(base.Communicator.encode(message))
+        self.assertTrue(math.isnan(decoded[0]))
+        self.assertEqual(message[1:], decoded[1:])
 
     def test_decode(self):
         """Tests for iblutil.io.net.base.Communicator.decode"""
@@ -90,6 +129,9 @@ class TestBase(unittest.IsolatedAsyncioTestCase):
         with self.assertWarns(Warning):
             decoded = base.Communicator.decode(data + b'"')
             self.assertEqual(decoded, '[null, 21, "message"]"')
+        # Check NaN values, which orjson does not parse
+        decoded = base.Communicator.decode(b'[NaN, 21]')
+        self.assertTrue(math.isnan(decoded[0]))
 
     async def test_is_success(self):
         """Tests for iblutil.io.net.base.is_success function."""
@@ -124,7 +166,8 @@ class TestUDP(unittest.IsolatedAsyncioTestCase):
         exp_ref = '2022-01-01_1_subject'
         with self.assertLogs(self.server.logger, logging.INFO) as log:
             await self.client.start(exp_ref)
-            self.assertIn(f'Received \'[{base.ExpMessage.EXPSTART}, "{exp_ref}", null]', log.records[-1].message)
+            expected = app.EchoProtocol.encode([base.ExpMessage.EXPSTART, exp_ref, None]).decode()
+            self.assertIn(f'Received {expected!r}', log.records[-1].message)
         spy.assert_called_with([exp_ref, None], (self.client._socket.getsockname()))
 
     async def test_callback_error(self):
@@ -271,17 +314,53 @@ class TestUDP(unittest.IsolatedAsyncioTestCase):
             self.client.default_echo_timeout = app.EchoProtocol.default_echo_timeout
         # Expect timeout arg to override default echo timeout, expect error raised on timeout
         assert self.client.is_connected
-        with mock.patch('iblutil.io.net.app.asyncio.wait_for', side_effect=asyncio.TimeoutError) as m, \
+        loop = asyncio.get_running_loop()
+        with mock.patch.object(self.client, '_send_bytes'), \
+                mock.patch.object(loop, 'call_later', wraps=loop.call_later) as m, \
                 self.assertRaises(TimeoutError):
             await self.client.confirmed_send(None, timeout=0.2)
-            self.assertFalse(self.client.is_connected, 'failed to close communicator on echo timeout error')
-        m.assert_awaited_once_with(mock.ANY, timeout=0.2)
+        m.assert_any_call(0.2, app._set_timeout, mock.ANY)
+        self.assertFalse(self.client.is_connected, 'failed to close communicator on echo timeout error')
+
         # Expect to raise RuntimeError with explanation when messages don't match
-        with mock.patch('iblutil.io.net.app.asyncio.wait_for', side_effect=RuntimeError), \
+        def mismatched_echo(_, addr=None):
+            self.client._last_sent[addr][1].set_exception(RuntimeError)
+
+        with mock.patch.object(self.client, '_send_bytes', side_effect=mismatched_echo), \
                 self.assertRaises(RuntimeError) as cm:
             await self.client.confirmed_send(None)
         self.assertIn('unexpected response', str(cm.exception).lower())
 
+    def test_send(self):
+        """Test for iblutil.io.net.app.EchoProtocol.send."""
+        with mock.patch.object(self.client, '_transport') as transport:
+            message = [base.ExpMessage.EXPINIT, None]
+            self.client.send(message)  # expect message to be serialized before passing to transport
+            transport.sendto.assert_called_once_with(app.EchoProtocol.encode(message), self.client._default_addr)
+
+    def test_encode_message(self):
+        """Test for iblutil.io.net.app.EchoProtocol._encode_message."""
+        message = (base.ExpMessage.EXPINIT, None)
+        encoded = self.client._encode_message(message)
+        self.assertEqual(app.EchoProtocol.encode(message), encoded)
+        self.assertIs(encoded, self.server._encode_message(message))
+        # Messages with data should be encoded as normal
+        message = (base.ExpMessage.EXPINIT, {'foo': 'bar'})
+        self.assertEqual(app.EchoProtocol.encode(message), self.client._encode_message(message))
+        # Non-finite floats in the message data should be preserved
+        self.assertIs(app.EchoProtocol.encode, base.Communicator.encode)
+        message = (base.ExpMessage.EXPINIT, {'foo': float('inf')})
+        self.assertEqual(b'[1, {"foo": Infinity}]', self.client._encode_message(message))
+
+    async def test_no_reference_cycle(self):
+        """Test that an EchoProtocol is freed without the cyclic garbage collector."""
+        gc.disable()
+        self.addCleanup(gc.enable)
+        protocol = app.EchoProtocol(self.client.server_uri, 'client')
+        ref = weakref.ref(protocol)
+        del protocol
+        self.assertIsNone(ref())
+
     def test_communicator(self):
         """Basic tests for iblutil.io.net.app.EchoProtocol, namely the role setter."""
         # Check role validation
@@ -291,10 +370,13 @@ class TestUDP(unittest.IsolatedAsyncioTestCase):
             app.EchoProtocol('localhost', 'foo')
         with self.assertRaises(AttributeError):
             self.client.role = 'foo'
+        # Check URI properties
+        self.assertEqual(f'{self.client.protocol}://{self.client.hostname}:{self.client.port}', self.client.server_uri)
+        self.assertEqual(('udp', base.LISTEN_PORT), (self.client.protocol, self.client.port))
 
     async def test_receive_validation(self):
         """Test for behaviour when non-standard message received."""
-        with self.assertWarns(RuntimeWarning), mock.patch.object(self.client, 'send'):
+        with self.assertWarns(RuntimeWarning), mock.patch.object(self.client, '_send_bytes'):
             self.client._receive(b'foo', (self.server.hostname, self.server.port))
         addr = (self.server.hostname, self.server.port)
         fut = asyncio.get_running_loop().create_future()
@@ -374,6 +456,7 @@ class TestWebSockets(unittest.IsolatedAsyncioTestCase):
         # Check socket indeed TCP
         self.assertIs(self.server._socket.type, app.socket.SOCK_STREAM)
         self.assertIs(self.client._socket.type, app.socket.SOCK_STREAM)
+        self.assertTrue(self.client._socket.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY))
 
         spy = mock.MagicMock()
         self.server.assign_callback('expstart', spy)
@@ -381,7 +464,8 @@ class TestWebSockets(unittest.IsolatedAsyncioTestCase):
         exp_ref = '2022-01-01_1_subject'
         with self.assertLogs(self.server.logger, logging.INFO) as log:
             await self.client.start(exp_ref)
-            self.assertIn(f'Received \'[{base.ExpMessage.EXPSTART}, "{exp_ref}", null]', log.records[-1].message)
+            expected = app.EchoProtocol.encode([base.ExpMessage.EXPSTART, exp_ref, None]).decode()
+            self.assertIn(f'Received {expected!r}', log.records[-1].message)
         spy.assert_called_with([exp_ref, None], (self.client._socket.getsockname()))
 
     def test_send_validation(self):
@@ -527,6 +611,32 @@ class TestServices(unittest.IsolatedAsyncioTestCase):
             with self.subTest(client=name):
                 self.assertEqual([42], value)
 
+    async def test_await_all_timeout(self):
+        """Test Services.await_all method when services fail to respond in time."""
+        services = app.Services((self.client_1, self.client_2), timeout=.1)
+        with self.assertRaises(asyncio.TimeoutError) as cm:
+            await services.await_all('EXPINIT')
+        self.assertIn('client1', str(cm.exception))
+        await asyncio.sleep(0)  # allow cancellation to propagate
+        # Expect the pending event futures to have been cancelled and removed
+        for client in services.values():
+            with self.subTest(client=client.name):
+                self.assertEqual([], client._callbacks[base.ExpMessage.EXPINIT])
+
+    async def test_signal_send_error(self):
+        """Test Services._signal method cleans up event callbacks when a send fails."""
+        services = app.Services((self.client_1, self.client_2), timeout=10)
+        for method, event in (('init', base.ExpMessage.EXPINIT), ('stop', base.ExpMessage.EXPEND)):
+            with self.subTest(method=method), \
+                    mock.patch.object(self.client_1, 'confirmed_send', side_effect=TimeoutError), \
+                    mock.patch.object(self.client_2, 'confirmed_send'):
+                with self.assertRaises(TimeoutError):
+                    await getattr(services, method)()
+                for _ in range(3):  # allow cancellation to propagate to await_all, then to the event tasks
+                    await asyncio.sleep(0)
+                for client in services.values():
+                    self.assertEqual([], client._callbacks[event], f'{client.name} callbacks not removed')
+
     async def test_service_methods(self):
         """Test start, stop, etc. methods.
 
@@ -584,6 +694,47 @@ class TestServices(unittest.IsolatedAsyncioTestCase):
             client.init.assert_awaited_once()
         self.assertEqual(responses, {'client_0': [0], 'client_1': [1]})
 
+    async def test_concurrent_signal(self):
+        """Test for Services._signal method with concurrent=True"""
+        calls = []
+
+        async def send(name, *args, **kwargs):
+            calls.append(('sent', name))
+            await asyncio.sleep(0)  # await echo
+            calls.append(('echoed', name))
+
+        clients = [mock.AsyncMock(spec=app.EchoProtocol), mock.AsyncMock(spec=app.EchoProtocol)]
+        for i, client in enumerate(clients):
+            client.name = f'client_{i}'
+            client.stop.side_effect = functools.partial(send, client.name)
+        services = app.Services(clients)
+        with mock.patch.object(services, 'await_all', return_value={}):
+            # The echoes should be awaited together
+            await services._signal(base.ExpMessage.EXPEND, 'stop')
+            expected = [('sent', 'client_0'), ('sent', 'client_1'), ('echoed', 'client_0'), ('echoed', 'client_1')]
+            self.assertEqual(expected, calls)
+            # In reverse, each service should echo before the next is signalled
+            calls.clear()
+            await services._signal(base.ExpMessage.EXPEND, 'stop', reverse=True)
+            expected = [('sent', 'client_1'), ('echoed', 'client_1'), ('sent', 'client_0'), ('echoed', 'client_0')]
+            self.assertEqual(expected, calls)
+
+        # Check pending sends and responses are cancelled when a send fails
+        loop = asyncio.get_running_loop()
+        echo, response = loop.create_future(), loop.create_future()
+        clients[0].stop.side_effect = TimeoutError
+
+        async def wait_for(fut, *args, **kwargs):
+            return await fut
+
+        clients[1].stop.side_effect = functools.partial(wait_for, echo)
+        with mock.patch.object(services, 'await_all', side_effect=functools.partial(wait_for, response)):
+            with self.assertRaises(TimeoutError):
+                await services._signal(base.ExpMessage.EXPEND, 'stop')
+        await asyncio.sleep(0)  # allow cancellation to propagate
+        self.assertTrue(echo.cancelled())
+        self.assertTrue(response.cancelled())
+
     def tearDown(self):
         self.client_1.close()
         self.client_2.close()
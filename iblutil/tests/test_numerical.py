@@ -1,4 +1,5 @@
 import unittest
+from unittest import mock
 import uuid
 
 import iblutil.numerical as num
@@ -80,6 +81,12 @@ class TestBetweeenSorted(unittest.TestCase):
         )
         assert np.all(ind == ind_)
 
+    def test_between_sorted_same_start(self):
+        # ranges starting at the same value should not cancel each other out
+        t = np.arange(40)
+        ind = num.between_sorted(t, np.array([[10, 20], [10, 30]]))
+        np.testing.assert_array_equal(t[ind], np.arange(10, 31))
+
     def test_between_sorted_out_of_range(self):
         # np searchsorted was returning out of range index when the start time
         # was greater than the max or the end time lower than the min
@@ -121,6 +128,45 @@ class TestIsmember(unittest.TestCase):
         lia_, locb_ = num.ismember2d(aa, bb)
         assert np.all(lia == lia_) & np.all(locb == locb_)
 
+    def test_intersect2d(self):
+        a0 = np.array([[1, 2], [3, 4], [5, 6], [5, 6]])
+        a1 = np.array([[3, 2], [5, 6], [1, 4], [1, 2]])
+        # the columns match in different rows for [1, 2] and [3, 4]
+        v, i0, i1 = num.intersect2d(a0, a1)
+        np.testing.assert_array_equal(v, [[1, 2], [5, 6]])
+        np.testing.assert_array_equal(i0, [0, 2])
+        np.testing.assert_array_equal(i1, [3, 1])
+        # the same without hashing the rows
+        v_, i0_, i1_ = num.intersect2d(a0.astype(np.int32), a1.astype(np.int32))
+        np.testing.assert_array_equal(v_, [[1, 2], [5, 6]])
+        np.testing.assert_array_equal(i0_, [0, 2])
+        np.testing.assert_array_equal(i1_, [3, 1])
+        # the intersection should be in lexicographic row order, whichever way the rows are sorted
+        rng = np.random.default_rng(42)
+        rows = rng.integers(np.iinfo(np.int32).min, np.iinfo(np.int32).max, size=(50, 2))
+        b0, b1 = rows[rng.integers(0, 50, 100)], rows[rng.integers(0, 50, 100)]
+        expected = sorted(set(map(tuple, b0)) & set(map(tuple, b1)))
+        for dtype in (np.int64, np.int32):
+            with self.subTest(dtype=dtype):
+                v, i0, i1 = num.intersect2d(b0.astype(dtype), b1.astype(dtype))
+                np.testing.assert_array_equal(v, expected)
+                np.testing.assert_array_equal(b1[i1], expected)
+        with self.assertWarns(DeprecationWarning):
+            num.intersect2d(b0, b1, assume_unique=True)
+        lia, locb = num.ismember2d(a0, a1)
+        np.testing.assert_array_equal(lia, [True, False, True, True])
+        np.testing.assert_array_equal(locb, [3, 1, 1])
+        # rows with the same hash should fall back on sorting the rows
+        y = np.uint64(2) * np.uint64(0x9E3779B97F4A7C15) ^ np.uint64(0x9E3779B97F4A7C15)
+        a0 = np.array([[1, 0], [2, y]], dtype=np.uint64)
+        a1 = np.array([[2, y], [3, 3]], dtype=np.uint64)
+        with mock.patch('iblutil.numerical._sorted_row_groups', wraps=num._sorted_row_groups) as sorted_row_groups:
+            v, i0, i1 = num.intersect2d(a0, a1)
+            sorted_row_groups.assert_called_with(a0, a1, hash_rows=False)
+        np.testing.assert_array_equal(v, a1[:1])
+        np.testing.assert_array_equal(i0, [1])
+        np.testing.assert_array_equal(i1, [0])
+
     def test_ismember(self):
         def _check_ismember(a, b, lia_, locb_):
             lia, locb = num.ismember(a, b)
@@ -189,6 +235,15 @@ class TestWithinRanges(unittest.TestCase):
         )
         np.testing.assert_array_equal(verifiable, expected)
 
+        # Unsorted points
+        x = np.array([5, 0, 9, 2, 7, 1, 8, 4, 10, 3, 6])
+        ranges = [(1, 2), (5, 8), (4, 6)]
+        for mode in ("vector", "matrix"):
+            with self.subTest(mode=mode):
+                verifiable = num.within_ranges(x, ranges, labels=[0, 1, 1], mode=mode)
+                expected = num.within_ranges(np.arange(11), ranges, labels=[0, 1, 1], mode=mode)
+                np.testing.assert_array_equal(verifiable, expected[..., x])
+
         # Edge cases
         verifiable = num.within_ranges(np.arange(11), [])
         expected = np.zeros(11, dtype=int)
@@ -1,3 +1,4 @@
+import sys
 import unittest
 import types
 import typing
@@ -46,14 +47,46 @@ class TestBunch(unittest.TestCase):
             npz_file = Path(td).joinpath('test_bunch.npz')
             abunch.save(npz_file)
             another_bunch = util.Bunch.load(npz_file)
-            [self.assertTrue(np.all(abunch[k]) == np.all(another_bunch[k])) for k in abunch]
+            for k in abunch:
+                np.testing.assert_array_equal(abunch[k], another_bunch[k])
             npz_filec = Path(td).joinpath('test_bunch_comp.npz')
             abunch.save(npz_filec, compress=True)
             another_bunch = util.Bunch.load(npz_filec)
-            [self.assertTrue(np.all(abunch[k]) == np.all(another_bunch[k])) for k in abunch]
+            for k in abunch:
+                np.testing.assert_array_equal(abunch[k], another_bunch[k])
             with self.assertRaises(FileNotFoundError):
                 util.Bunch.load(Path(td) / 'fake.npz')
 
+    def test_bunch_io_stacked(self):
+        abunch = util.Bunch({f'trial{i}': np.random.rand(50, 2) for i in range(5)})
+        abunch.update(n=np.arange(10), flag=True, x=1.5)
+        with tempfile.TemporaryDirectory() as td:
+            for compress in (False, True):
+                npz_file = Path(td).joinpath(f'test_bunch_{compress}.npz')
+                abunch.save_stacked(npz_file, compress=compress)
+                another_bunch = util.Bunch.load_stacked(npz_file)
+                self.assertEqual(list(abunch.keys()), list(another_bunch.keys()))
+                for k in abunch:
+                    np.testing.assert_array_equal(abunch[k], another_bunch[k])
+                # Values of the same shape and dtype should be stored in the same array
+                with np.load(npz_file) as data:
+                    self.assertEqual(5, len(data.files))
+            with self.assertRaises(FileNotFoundError):
+                util.Bunch.load_stacked(Path(td) / 'fake.npz')
+            # Check keys and values that cannot be loaded without pickle are rejected up front
+            npz_file = Path(td).joinpath('test_bunch_invalid.npz')
+            invalid = (
+                ({'a': 1}, TypeError),
+                (np.array([None, 1]), TypeError),
+                ([[1, 2], [3]], (TypeError, ValueError))  # ragged sequences are object dtype in numpy < 1.24
+            )
+            for value, err in invalid:
+                with self.subTest(value=value), self.assertRaises(err):
+                    util.Bunch(a=np.arange(3), b=value).save_stacked(npz_file)
+            with self.assertRaises(TypeError):
+                util.Bunch({'a': np.arange(3), 1: np.arange(3)}).save_stacked(npz_file)
+            self.assertFalse(npz_file.exists())
+
 
 class TestFlatten(unittest.TestCase):
 
@@ -63,6 +96,12 @@ class TestFlatten(unittest.TestCase):
         self.assertEqual(util.flatten(x)[:5], [1, 2, 3, 1, 2])
         self.assertEqual(list(util._gflatten(x)), list(util.flatten(x, generator=True)))
         self.assertIsInstance(util.flatten(x, generator=True), types.GeneratorType)
+        # Check deeply nested input
+        x = [1]
+        for _ in range(sys.getrecursionlimit()):
+            x = [x, 2]
+        self.assertEqual([1] + [2] * sys.getrecursionlimit(), util.flatten(x))
+        self.assertEqual([1] + [2] * sys.getrecursionlimit(), list(util.flatten(x, generator=True)))
 
 
 class TestRangeStr(unittest.TestCase):
@@ -76,6 +115,9 @@ class TestRangeStr(unittest.TestCase):
 
         self.assertEqual(util.range_str([]), '')
 
+        # Unordered input should be sorted
+        self.assertEqual(util.range_str({64, 1, 2, 33}), '1-2, 33 & 64')
+
 
 class TestLogger(unittest.TestCase):
     log_name = '_foobar'
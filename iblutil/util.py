@@ -3,14 +3,12 @@ from itertools import takewhile
 from os import scandir
 from pathlib import Path
 import collections
-import colorlog
 import copy
+import json
 import logging
 import sys
 from typing import Union, Iterable, Sequence
 
-import numpy as np
-
 log = logging.getLogger('__name__')
 
 LOG_FORMAT_STR = u'%(asctime)s %(levelname)-8s %(filename)s:%(lineno)-4d %(message)s'
@@ -55,7 +53,7 @@ class Bunch(dict):
         - A deep copy constructs a new Bunch and then, recursively, inserts copies into it of the
          objects found in the original.
         """
-        return copy.deepcopy(self) if deep else Bunch(super(Bunch, self).copy())
+        return copy.deepcopy(self) if deep else Bunch(self)
 
     def save(self, npz_file, compress=False):
         """
@@ -65,6 +63,7 @@ class Bunch(dict):
         :param compress: bool (False) use compression
         :return: None
         """
+        import numpy as np
         if compress:
             np.savez_compressed(npz_file, **self)
         else:
@@ -80,29 +79,93 @@ class Bunch(dict):
         """
         if not Path(npz_file).exists():
             raise FileNotFoundError(f"{npz_file}")
-        return Bunch(np.load(npz_file))
+        import numpy as np
+        with np.load(npz_file) as data:  # arrays are read eagerly so the archive can be closed
+            return Bunch(data)
+
+    def save_stacked(self, npz_file, compress=False):
+        """
+        Saves a npz file with the values of the bunch stacked into one array per dtype and shape.
+
+        This results in fewer, larger arrays than `Bunch.save` when the bunch contains many arrays
+        of the same dtype and shape, e.g. per-trial data.  Load the file with `Bunch.load_stacked`.
+        Keys must be strings and values must convert to non-object numpy arrays, i.e. not ragged
+        sequences, dicts or other arbitrary objects, so that the file can be loaded without pickle.
+
+        :param npz_file: output file
+        :param compress: bool (False) use compression
+        :return: None
+        :raises TypeError: a key is not a string or a value has object dtype
+        :raises ValueError: a value is a ragged sequence
+        """
+        import numpy as np
+        if not all(isinstance(key, str) for key in self):
+            raise TypeError('Bunch.save_stacked: keys must be str, got ' +
+                            ', '.join(repr(k) for k in self if not isinstance(k, str)))
+        groups, index = {}, {}
+        for key, value in self.items():
+            try:
+                value = np.asarray(value)
+            except ValueError as ex:  # e.g. inhomogeneous shape
+                raise ValueError(f'Bunch.save_stacked: value of {key!r} is not a regular array') from ex
+            if value.dtype.hasobject:
+                raise TypeError(f'Bunch.save_stacked: value of {key!r} has object dtype')
+            name, values = groups.setdefault((value.dtype.str, value.shape), (f'group{len(groups)}', []))
+            index[key] = (name, len(values))
+            values.append(value)
+        arrays = {name: np.stack(values) for name, values in groups.values()}
+        # The index maps each key to its group array and row number
+        arrays['index'] = np.array(json.dumps(index))
+        if compress:
+            np.savez_compressed(npz_file, **arrays)
+        else:
+            np.savez(npz_file, **arrays)
+
+    @staticmethod
+    def load_stacked(npz_file):
+        """
+        Loads a npz file saved with `Bunch.save_stacked`.
+
+        The values of the returned bunch are views into the stacked arrays.
+
+        :param npz_file: input file
+        :return: Bunch
+        """
+        if not Path(npz_file).exists():
+            raise FileNotFoundError(f"{npz_file}")
+        import numpy as np
+        with np.load(npz_file) as data:
+            index = json.loads(data['index'].item())
+            groups = {name: data[name] for name in set(name for name, _ in index.values())}
+        return Bunch({key: groups[name][i, ...] for key, (name, i) in index.items()})
 
 
 def _iflatten(x):
+    # Iterate using a stack of iterators rather than recursion to support deeply nested input
     result = []
-    for el in x:
-        if isinstance(el, collections.abc.Iterable) and not (
-                isinstance(el, str) or isinstance(el, dict)):
-            result.extend(_iflatten(el))
-        else:
+    stack = [iter(x)]
+    while stack:
+        for el in stack[-1]:
+            if isinstance(el, collections.abc.Iterable) and not isinstance(el, (str, dict)):
+                stack.append(iter(el))
+                break
             result.append(el)
+        else:
+            stack.pop()
     return result
 
 
 def _gflatten(x):
-    def iselement(e):
-        return not (isinstance(e, collections.abc.Iterable) and not (
-            isinstance(el, str) or isinstance(el, dict)))
-    for el in x:
-        if iselement(el):
+    # Generator equivalent of _iflatten, using the same stack of iterators
+    stack = [iter(x)]
+    while stack:
+        for el in stack[-1]:
+            if isinstance(el, collections.abc.Iterable) and not isinstance(el, (str, dict)):
+                stack.append(iter(el))
+                break
             yield el
         else:
-            yield from _gflatten(el)
+            stack.pop()
 
 
 def flatten(x, generator=False):
@@ -129,16 +192,15 @@ def range_str(values: iter) -> str:
     :param values: An iterable of ints
     :return: A string of unique value ranges
     """
-    trial_str = ''
-    values = list(set(values))
-    for i in range(len(values)):
-        if i == 0:
-            trial_str += str(values[i])
-        elif values[i] - (values[i - 1]) == 1:
-            if i == len(values) - 1 or values[i + 1] - values[i] > 1:
-                trial_str += f'-{values[i]}'
-        else:
-            trial_str += f', {values[i]}'
+    import numpy as np
+    values = np.unique(list(values))  # sorted unique values
+    if values.size == 0:
+        return ''
+    # The first and last index of each run of consecutive values
+    starts = np.r_[0, np.flatnonzero(np.diff(values) != 1) + 1]
+    ends = np.r_[starts[1:], values.size] - 1
+    runs = zip(values[starts].tolist(), values[ends].tolist())
+    trial_str = ', '.join(str(first) if first == last else f'{first}-{last}' for first, last in runs)
     # Replace final comma with an ampersand
     k = trial_str.rfind(',')
     if k > -1:
@@ -171,6 +233,7 @@ def setup_logger(name='ibl', level=logging.NOTSET, file=None, no_color=False):
     logging.Logger, logging.RootLogger
         The configured log.
     """
+    import colorlog
     log = logging.getLogger() if not name else logging.getLogger(name)
     log.setLevel(level)
     fkwargs = {'no_color': True} if no_color else {'log_colors': LOG_COLORS}